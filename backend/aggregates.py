@@ -0,0 +1,150 @@
+"""Per-trip denormalized aggregates and the command that rebuilds them.
+
+Handlers in server.py keep ``expense_total``, ``expense_count`` and
+``itinerary_count`` on each trip up to date with ``$inc``. Run this module to
+recompute them from the expenses and itineraries collections, e.g. after the
+first deploy or if they are suspected to have drifted::
+
+    python aggregates.py              # every trip
+    python aggregates.py <trip_id>... # selected trips
+"""
+import argparse
+import asyncio
+import logging
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from pymongo import UpdateOne
+
+logger = logging.getLogger(__name__)
+
+TRIP_AGGREGATE_FIELDS = ("expense_total", "expense_count", "itinerary_count")
+# Every counter kept on a trip; expense_seq hands out the next expense nomor
+TRIP_COUNTER_FIELDS = TRIP_AGGREGATE_FIELDS + ("expense_seq",)
+# Trips created before the counters existed (or only partly updated since) miss some of them
+COUNTERS_MISSING = {"$or": [{field: {"$exists": False}} for field in TRIP_COUNTER_FIELDS]}
+COUNTERS_PRESENT = {field: {"$exists": True} for field in TRIP_COUNTER_FIELDS}
+
+
+def stored_totals(trip: dict):
+    """Bundle-style totals from a trip document, or None if it predates the aggregates."""
+    if not all(field in trip for field in TRIP_AGGREGATE_FIELDS):
+        return None
+    return {
+        "total_expense": trip["expense_total"],
+        "expense_count": trip["expense_count"],
+        "itinerary_count": trip["itinerary_count"],
+    }
+
+
+async def compute_trip_aggregates(db, trip_ids: list, session=None) -> dict:
+    """Counters of the given trips recomputed from their expenses and itineraries, by trip id."""
+    expense_rows = await db.expenses.aggregate([
+        {"$match": {"trip_id": {"$in": trip_ids}}},
+        {"$group": {"_id": "$trip_id", "total": {"$sum": "$jumlah"}, "count": {"$sum": 1}, "max_nomor": {"$max": "$nomor"}}},
+    ], session=session).to_list(None)
+    itinerary_rows = await db.itineraries.aggregate([
+        {"$match": {"trip_id": {"$in": trip_ids}}},
+        {"$group": {"_id": "$trip_id", "count": {"$sum": 1}}},
+    ], session=session).to_list(None)
+    expenses = {row["_id"]: row for row in expense_rows}
+    itineraries = {row["_id"]: row["count"] for row in itinerary_rows}
+
+    aggregates = {}
+    for trip_id in trip_ids:
+        exp = expenses.get(trip_id, {"total": 0, "count": 0, "max_nomor": 0})
+        aggregates[trip_id] = {
+            "expense_total": exp["total"],
+            "expense_count": exp["count"],
+            "itinerary_count": itineraries.get(trip_id, 0),
+            # Never hand out a number that is already taken, even if old data has gaps
+            "expense_seq": max(exp["count"], exp["max_nomor"] or 0),
+        }
+    return aggregates
+
+
+async def seed_trip_aggregates(db, trip_ids: list, session=None) -> int:
+    """Fill in the counters of trips that lack any of them; returns the number of trips seeded.
+
+    Runs once per legacy trip, before the first ``$inc`` on its counters, so
+    the increment lands on the real totals instead of creating a field that
+    only holds the new rows.
+    """
+    legacy = await db.trips.find(
+        {"id": {"$in": trip_ids}, **COUNTERS_MISSING}, {"_id": 0, "id": 1}, session=session
+    ).to_list(None)
+    if not legacy:
+        return 0
+    aggregates = await compute_trip_aggregates(db, [t["id"] for t in legacy], session)
+    now = datetime.now(timezone.utc).isoformat()
+    requests = []
+    for trip_id, values in aggregates.items():
+        seq = values.pop("expense_seq")
+        requests.append(UpdateOne({"id": trip_id, **COUNTERS_MISSING}, {
+            "$set": {**values, "updated_at": now},
+            "$max": {"expense_seq": seq},
+            "$inc": {"version": 1},
+        }))
+    result = await db.trips.bulk_write(requests, ordered=False, session=session)
+    return result.modified_count
+
+
+async def _repair_batch(db, trip_ids: list) -> int:
+    aggregates = await compute_trip_aggregates(db, trip_ids)
+    now = datetime.now(timezone.utc).isoformat()
+    requests = [
+        # Only trips whose counters drifted match, so only those get a new version (and ETag)
+        UpdateOne(
+            {"id": trip_id, "$or": [{field: {"$ne": value}} for field, value in values.items()]},
+            {"$set": {**values, "updated_at": now}, "$inc": {"version": 1}},
+        )
+        for trip_id, values in aggregates.items()
+    ]
+    result = await db.trips.bulk_write(requests, ordered=False)
+    return result.modified_count
+
+
+async def repair_trip_aggregates(db, trip_ids=None, batch_size: int = 500) -> dict:
+    """Recompute the aggregates of the given trips (all trips by default) in batches."""
+    query = {"id": {"$in": list(trip_ids)}} if trip_ids else {}
+    scanned = modified = 0
+    batch = []
+    async for trip in db.trips.find(query, {"_id": 0, "id": 1}):
+        batch.append(trip["id"])
+        if len(batch) >= batch_size:
+            modified += await _repair_batch(db, batch)
+            scanned += len(batch)
+            batch = []
+    if batch:
+        modified += await _repair_batch(db, batch)
+        scanned += len(batch)
+    logger.info(f"Trip aggregates repaired: {scanned} scanned, {modified} modified")
+    return {"scanned": scanned, "modified": modified}
+
+
+async def _run(trip_ids, batch_size: int) -> dict:
+    from motor.motor_asyncio import AsyncIOMotorClient
+
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    try:
+        return await repair_trip_aggregates(client[os.environ['DB_NAME']], trip_ids, batch_size)
+    finally:
+        client.close()
+
+
+def main():
+    from dotenv import load_dotenv
+
+    parser = argparse.ArgumentParser(description="Recompute per-trip expense/itinerary aggregates")
+    parser.add_argument("trip_ids", nargs="*", help="only repair these trips")
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    load_dotenv(Path(__file__).parent / '.env')
+    print(asyncio.run(_run(args.trip_ids, args.batch_size)))
+
+
+if __name__ == "__main__":
+    main()
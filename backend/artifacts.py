@@ -0,0 +1,114 @@
+"""Finalized report artifacts stored in GridFS.
+
+Reports of completed trips are rendered once per (trip, format, data version)
+and kept as immutable GridFS files, so audit downloads years later stream the
+document that was issued instead of re-rendering it from live data.
+"""
+import hashlib
+import json
+import re
+
+from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+
+ARTIFACT_BUCKET = "report_artifacts"
+ARTIFACT_CHUNK_BYTES = 255 * 1024
+
+# Fields listed by the artifacts endpoint
+ARTIFACT_LIST_PROJECTION = {"_id": 1, "filename": 1, "length": 1, "uploadDate": 1, "metadata": 1}
+
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiableError(Exception):
+    pass
+
+
+def data_version(data: dict) -> str:
+    """Hash of the report data, without the render date or layout version."""
+    payload = {
+        "user": data["user"],
+        "trip": data["trip"],
+        "itineraries": data["itineraries"],
+        "expenses": data["expenses"],
+        "template": data.get("template"),
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def parse_range(header: str, length: int):
+    """Parse a single ``bytes=`` range into inclusive (start, end).
+
+    Returns None when there is no usable range (absent, multi-range or another
+    unit), in which case the whole file is served.
+    """
+    if not header:
+        return None
+    match = _RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(length - int(last), 0), length - 1
+    else:
+        start = int(first)
+        end = min(int(last), length - 1) if last else length - 1
+    if start >= length or start > end:
+        raise RangeNotSatisfiableError(f"range {header} outside 0-{length - 1}")
+    return start, end
+
+
+class ArtifactStore:
+    def __init__(self, db, bucket_name: str = ARTIFACT_BUCKET, chunk_size: int = ARTIFACT_CHUNK_BYTES):
+        self.db = db
+        self.bucket_name = bucket_name
+        self.chunk_size = chunk_size
+        self._bucket = None
+
+    @property
+    def files(self):
+        return self.db[f"{self.bucket_name}.files"]
+
+    @property
+    def bucket(self) -> AsyncIOMotorGridFSBucket:
+        if self._bucket is None:
+            self._bucket = AsyncIOMotorGridFSBucket(self.db, bucket_name=self.bucket_name,
+                                                    chunk_size_bytes=self.chunk_size)
+        return self._bucket
+
+    async def find(self, trip_id: str, format: str, version: str):
+        return await self.files.find_one(
+            {"metadata.trip_id": trip_id, "metadata.format": format, "metadata.data_version": version},
+            sort=[("uploadDate", -1)],
+        )
+
+    async def get(self, file_id, user_id: str):
+        return await self.files.find_one({"_id": file_id, "metadata.user_id": user_id})
+
+    async def list(self, trip_id: str, user_id: str, limit: int = 100):
+        return await self.files.find(
+            {"metadata.trip_id": trip_id, "metadata.user_id": user_id}, ARTIFACT_LIST_PROJECTION
+        ).sort("uploadDate", -1).to_list(limit)
+
+    async def put(self, filename: str, content: bytes, metadata: dict) -> dict:
+        file_id = await self.bucket.upload_from_stream(filename, content, metadata=metadata)
+        return await self.files.find_one({"_id": file_id})
+
+    async def stream(self, file_id, start: int, end: int):
+        """Yield bytes start..end (inclusive) one GridFS chunk at a time."""
+        grid_out = await self.bucket.open_download_stream(file_id)
+        try:
+            grid_out.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await grid_out.readchunk()
+                if not chunk:
+                    break
+                chunk = chunk[:remaining]
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            grid_out.close()
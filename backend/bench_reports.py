@@ -0,0 +1,74 @@
+"""Report builder benchmark.
+
+Renders synthetic trips with growing itinerary/expense lists and checks that
+build time per row stays flat, i.e. rendering is linear in the row count:
+
+    python bench_reports.py --rows 500 1000 2000 5000 --format pdf
+"""
+import argparse
+import sys
+import time
+
+from reports import BUILDERS
+
+
+def sample_data(rows: int) -> dict:
+    expenses = [
+        {"nomor": i + 1, "tanggal": "2025-01-01", "uraian": f"Biaya perjalanan {i + 1}", "jumlah": 150000.0}
+        for i in range(rows)
+    ]
+    return {
+        "user": {"full_name": "Pegawai Contoh", "nip": "198001012005011001", "jabatan": "Analis", "unit": "Umum"},
+        "trip": {
+            "judul": "Perjalanan Contoh", "tujuan": "Jakarta",
+            "tanggal_mulai": "2025-01-01", "tanggal_selesai": "2025-01-05",
+            "dasar_perjalanan": "Surat Tugas", "maksud_tujuan": "Koordinasi",
+        },
+        "itineraries": [
+            {"tanggal": "2025-01-01", "waktu": "08:00", "kegiatan": f"Kegiatan {i + 1}", "lokasi": "Kantor"}
+            for i in range(rows)
+        ],
+        "expenses": expenses,
+        "total_expense": sum(e["jumlah"] for e in expenses),
+    }
+
+
+def measure(format: str, rows: int, repeat: int) -> float:
+    data = sample_data(rows)
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        BUILDERS[format](data)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark report builders against row count")
+    parser.add_argument("--rows", type=int, nargs="+", default=[500, 1000, 2000, 5000])
+    parser.add_argument("--format", choices=sorted(BUILDERS), default="pdf")
+    parser.add_argument("--repeat", type=int, default=3, help="keep the best of N runs per size")
+    parser.add_argument("--tolerance", type=float, default=1.5,
+                        help="max allowed ratio between the slowest and fastest per-row time")
+    args = parser.parse_args()
+
+    # Warm imports and the template registry so the first size is not penalised
+    measure(args.format, 10, 1)
+
+    per_row = []
+    print(f"{'rows':>8} {'seconds':>10} {'ms/row':>8}")
+    for rows in sorted(args.rows):
+        elapsed = measure(args.format, rows, args.repeat)
+        per_row.append(elapsed / rows)
+        print(f"{rows:>8} {elapsed:>10.3f} {elapsed / rows * 1000:>8.3f}")
+
+    ratio = max(per_row) / min(per_row)
+    print(f"per-row time ratio: {ratio:.2f} (tolerance {args.tolerance})")
+    if ratio > args.tolerance:
+        print("NOT LINEAR")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
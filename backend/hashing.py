@@ -0,0 +1,65 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+HASH_WAIT_SECONDS = metrics.histogram(
+    "password_hash_wait_seconds", "Time a bcrypt job spent queued before a worker picked it up", ["op"]
+)
+HASH_DURATION_SECONDS = metrics.histogram(
+    "password_hash_duration_seconds", "Time spent inside bcrypt hash/verify", ["op"]
+)
+HASH_REJECTED = metrics.counter(
+    "password_hash_rejected_total", "bcrypt jobs rejected because the queue was full", ["op"]
+)
+
+
+class HashingBusyError(Exception):
+    pass
+
+
+class PasswordHasher:
+    """Runs passlib hash/verify on a dedicated thread pool.
+
+    At most ``max_workers`` bcrypt calls run at once and at most ``max_queue``
+    more wait for a worker; beyond that ``HashingBusyError`` is raised so the
+    caller can shed load instead of piling up requests.
+    """
+
+    def __init__(self, context, max_workers: int = 4, max_queue: int = 64):
+        self.context = context
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._pending = 0
+
+    async def _run(self, op: str, fn, *args):
+        if self._pending >= self.max_workers + self.max_queue:
+            HASH_REJECTED.inc(op=op)
+            raise HashingBusyError(f"bcrypt queue full ({self._pending} pending)")
+
+        submitted = time.perf_counter()
+
+        def job():
+            started = time.perf_counter()
+            HASH_WAIT_SECONDS.observe(started - submitted, op=op)
+            try:
+                return fn(*args)
+            finally:
+                HASH_DURATION_SECONDS.observe(time.perf_counter() - started, op=op)
+
+        self._pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._executor, job)
+        finally:
+            self._pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run("hash", self.context.hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run("verify", self.context.verify, plain_password, hashed_password)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
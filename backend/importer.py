@@ -0,0 +1,82 @@
+import asyncio
+import codecs
+import csv
+from datetime import date, datetime, time
+from itertools import islice
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def detect_format(filename: str, content_type: str = None) -> str:
+    name = (filename or "").lower()
+    if name.endswith(".csv") or content_type == "text/csv":
+        return "csv"
+    if name.endswith(".xlsx") or content_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet":
+        return "xlsx"
+    raise ImportFormatError("Format file harus CSV atau XLSX")
+
+
+def normalize_cell(value):
+    # Spreadsheet cells arrive typed; the models expect the same strings the API accepts
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d") if value.time() == time() else value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, time):
+        return value.strftime("%H:%M")
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    value = str(value).strip()
+    return value or None
+
+
+def _rows_to_dicts(header, rows, first_row_number: int):
+    columns = [str(h).strip().lower() if h is not None else None for h in header]
+    for row_number, row in enumerate(rows, first_row_number):
+        values = {}
+        for column, value in zip(columns, row):
+            value = normalize_cell(value)
+            if column and value is not None:
+                values[column] = value
+        if values:
+            yield row_number, values
+
+
+def iter_csv_rows(fileobj):
+    """Yield (row number, {column: value}) from a binary CSV file object, one line at a time."""
+    reader = csv.reader(codecs.getreader("utf-8-sig")(fileobj))
+    header = next(reader, None)
+    if header is None:
+        return
+    yield from _rows_to_dicts(header, reader, 2)
+
+
+def iter_xlsx_rows(fileobj):
+    """Yield (row number, {column: value}) from the first sheet using openpyxl's read-only streaming mode."""
+    from openpyxl import load_workbook
+
+    try:
+        wb = load_workbook(fileobj, read_only=True, data_only=True)
+    except Exception as e:
+        raise ImportFormatError(f"File XLSX tidak valid: {e}")
+    try:
+        rows = wb.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return
+        yield from _rows_to_dicts(header, rows, 2)
+    finally:
+        wb.close()
+
+
+async def iter_chunks(rows, size: int):
+    """Pull ``size`` rows at a time from a blocking row iterator on a worker thread."""
+    while True:
+        chunk = await asyncio.to_thread(lambda: list(islice(rows, size)))
+        if not chunk:
+            return
+        yield chunk
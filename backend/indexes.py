@@ -0,0 +1,114 @@
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Declared indexes per collection. Every handler query in server.py should be
+# covered by one of these; keep the names stable, they are used to detect drift.
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "trips": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)], name="user_created_id"),
+        IndexModel([("user_id", ASCENDING), ("updated_at", ASCENDING)], name="user_updated"),
+    ],
+    "itineraries": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("trip_id", ASCENDING), ("tanggal", ASCENDING), ("waktu", ASCENDING)], name="trip_schedule"),
+        IndexModel([("trip_id", ASCENDING), ("updated_at", ASCENDING)], name="trip_updated"),
+    ],
+    "expenses": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("trip_id", ASCENDING), ("nomor", ASCENDING)], name="trip_nomor"),
+        IndexModel([("trip_id", ASCENDING), ("updated_at", ASCENDING)], name="trip_updated"),
+    ],
+    "report_jobs": [
+        IndexModel([("id", ASCENDING)], name="id_unique", unique=True),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING)], name="status_created"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+    "trip_purges": [
+        IndexModel([("created_at", ASCENDING)], name="created"),
+    ],
+    "tombstones": [
+        IndexModel([("user_id", ASCENDING), ("deleted_at", ASCENDING)], name="user_deleted"),
+        IndexModel([("expires_at", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+    # GridFS bucket for archived reports; the *_1 indexes mirror the ones the driver creates itself
+    "report_artifacts.files": [
+        IndexModel([("filename", ASCENDING), ("uploadDate", ASCENDING)], name="filename_1_uploadDate_1"),
+        IndexModel([("metadata.trip_id", ASCENDING), ("metadata.format", ASCENDING),
+                    ("metadata.data_version", ASCENDING), ("uploadDate", DESCENDING)], name="trip_format_version"),
+    ],
+    "report_artifacts.chunks": [
+        IndexModel([("files_id", ASCENDING), ("n", ASCENDING)], name="files_id_1_n_1", unique=True),
+    ],
+}
+
+# Index options compared when checking an existing index against its declaration
+_COMPARED_OPTIONS = ("unique", "sparse", "partialFilterExpression", "expireAfterSeconds")
+
+
+def _normalize_key(key):
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in key]
+
+
+def _diff_index(declared: dict, existing: dict):
+    problems = []
+    if _normalize_key(declared["key"].items()) != _normalize_key(existing["key"]):
+        problems.append(f"key {existing['key']} != {list(declared['key'].items())}")
+    for option in _COMPARED_OPTIONS:
+        if declared.get(option) != existing.get(option):
+            problems.append(f"{option} {existing.get(option)!r} != {declared.get(option)!r}")
+    return problems
+
+
+async def ensure_indexes(db, indexes: dict = None) -> dict:
+    """Create missing indexes and report drift between declared and existing ones.
+
+    Safe to run on every startup: indexes that already match are left alone.
+    Returns a report keyed by collection with ``created``, ``drifted`` and
+    ``undeclared`` index names.
+    """
+    indexes = INDEXES if indexes is None else indexes
+    report = {}
+    for collection_name, models in indexes.items():
+        collection = db[collection_name]
+        existing = await collection.index_information()
+        entry = {"created": [], "drifted": {}, "undeclared": []}
+
+        missing = []
+        for model in models:
+            spec = model.document
+            name = spec["name"]
+            if name not in existing:
+                missing.append(model)
+                continue
+            problems = _diff_index(spec, existing[name])
+            if problems:
+                entry["drifted"][name] = problems
+
+        if missing:
+            try:
+                entry["created"] = await collection.create_indexes(missing)
+            except OperationFailure as e:
+                logger.error("Failed to create indexes on %s: %s", collection_name, e)
+
+        declared_names = {model.document["name"] for model in models}
+        entry["undeclared"] = sorted(name for name in existing if name != "_id_" and name not in declared_names)
+
+        for name, problems in entry["drifted"].items():
+            logger.warning("Index drift on %s.%s: %s", collection_name, name, "; ".join(problems))
+        if entry["undeclared"]:
+            logger.warning("Undeclared indexes on %s: %s", collection_name, ", ".join(entry["undeclared"]))
+        if entry["created"]:
+            logger.info("Created indexes on %s: %s", collection_name, ", ".join(entry["created"]))
+
+        report[collection_name] = entry
+    return report
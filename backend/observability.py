@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import time
+
+from pymongo import monitoring
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = metrics.counter(
+    "http_requests_total", "HTTP requests by method, route template and status code", ["method", "route", "status"]
+)
+HTTP_REQUEST_DURATION_SECONDS = metrics.histogram(
+    "http_request_duration_seconds", "Time from request start until the last body chunk is sent", ["method", "route"]
+)
+MONGO_COMMAND_DURATION_SECONDS = metrics.histogram(
+    "mongo_command_duration_seconds", "MongoDB command round trip time by collection and command",
+    ["collection", "command"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+MONGO_COMMAND_FAILURES = metrics.counter(
+    "mongo_command_failures_total", "MongoDB commands that returned an error", ["collection", "command"]
+)
+EVENT_LOOP_LAG_SECONDS = metrics.histogram(
+    "event_loop_lag_seconds", "Delay of a periodic event loop callback beyond its scheduled time",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+EVENT_LOOP_LAG_LAST_SECONDS = metrics.gauge("event_loop_lag_last_seconds", "Most recent event loop lag sample")
+
+
+class RequestMetricsMiddleware:
+    """ASGI middleware recording request count and latency per route template.
+
+    Labels use the matched route's path (``/api/trips/{trip_id}``), never the
+    raw URL, so ids do not blow up the series count. Streaming responses are
+    timed until their last chunk is sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "unmatched"
+            method = scope["method"]
+            HTTP_REQUESTS.inc(method=method, route=template, status=status["code"])
+            HTTP_REQUEST_DURATION_SECONDS.observe(time.perf_counter() - started, method=method, route=template)
+
+
+# Commands run by the driver itself; they would only add noise
+_IGNORED_COMMANDS = {"hello", "ismaster", "isMaster", "ping", "saslStart", "saslContinue", "endSessions"}
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """PyMongo command listener timing every command per collection.
+
+    Events are delivered on the driver's threads; the started event carries
+    the collection name, so it is kept until the matching completion event.
+    """
+
+    def __init__(self):
+        self._pending = {}
+
+    @staticmethod
+    def _key(event):
+        return event.request_id, event.connection_id
+
+    def started(self, event):
+        if event.command_name in _IGNORED_COMMANDS:
+            return
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        else:
+            collection = event.command.get(event.command_name)
+        self._pending[self._key(event)] = collection if isinstance(collection, str) else ""
+
+    def succeeded(self, event):
+        collection = self._pending.pop(self._key(event), None)
+        if collection is not None:
+            MONGO_COMMAND_DURATION_SECONDS.observe(
+                event.duration_micros / 1e6, collection=collection, command=event.command_name
+            )
+
+    def failed(self, event):
+        collection = self._pending.pop(self._key(event), None)
+        if collection is not None:
+            MONGO_COMMAND_DURATION_SECONDS.observe(
+                event.duration_micros / 1e6, collection=collection, command=event.command_name
+            )
+            MONGO_COMMAND_FAILURES.inc(collection=collection, command=event.command_name)
+
+
+class EventLoopLagMonitor:
+    """Samples how late the event loop runs a callback scheduled every ``interval`` seconds."""
+
+    def __init__(self, interval: float = 0.5):
+        self.interval = interval
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            EVENT_LOOP_LAG_SECONDS.observe(lag)
+            EVENT_LOOP_LAG_LAST_SECONDS.set(lag)
@@ -0,0 +1,110 @@
+"""Long report tables laid out one page at a time.
+
+ReportLab re-wraps every remaining row each time it splits a ``Table`` across
+pages, so one big table renders in quadratic time. ``PagedTable`` measures the
+rows once and, on each page, builds a ``Table`` of only the rows that fit in the
+space left in the frame, which keeps rendering linear in the row count.
+Imported lazily by ``reports.build_pdf`` like the rest of ReportLab.
+"""
+from bisect import bisect_right
+
+from reportlab.platypus import Flowable
+
+# Rows per Table built while measuring row heights
+MEASURE_ROWS = 200
+
+
+class PagedTable(Flowable):
+    """Rows ``start:`` of a table, cut at page boundaries, below an optional heading.
+
+    ``make_table(start, stop)`` builds the Table for rows ``start:stop``: one
+    header row, the data rows, then any trailing rows (e.g. page subtotals).
+    The heading is drawn with the first piece, so it never ends up alone at
+    the bottom of a page.
+    """
+
+    def __init__(self, make_table, row_count: int, heading=None, start: int = 0, _offsets=None):
+        super().__init__()
+        self.make_table = make_table
+        self.row_count = row_count
+        self.heading = heading
+        self.start = start
+        # _offsets[i]: height of data rows 0..i-1, shared by every piece of one table
+        self._offsets = _offsets
+        self._header_height = 0
+        self._table = None
+
+    def _measure(self, avail_width, avail_height):
+        if self._offsets is not None:
+            return
+        offsets = [0]
+        for first in range(0, self.row_count, MEASURE_ROWS):
+            stop = min(first + MEASURE_ROWS, self.row_count)
+            table = self.make_table(first, stop)
+            table.wrap(avail_width, avail_height)
+            for height in table._rowHeights[1:1 + stop - first]:
+                offsets.append(offsets[-1] + height)
+        self._offsets = offsets
+
+    def _rows_height(self, start, stop):
+        return self._offsets[stop] - self._offsets[start]
+
+    def _heading_height(self, avail_width, avail_height):
+        if self.heading is None:
+            return 0
+        _, height = self.heading.wrap(avail_width, avail_height)
+        return height + self.heading.getSpaceAfter()
+
+    def getSpaceBefore(self):
+        return self.heading.getSpaceBefore() if self.heading is not None else 0
+
+    def wrap(self, avail_width, avail_height):
+        self._measure(avail_width, avail_height)
+        heading = self._heading_height(avail_width, avail_height)
+        rows = self._rows_height(self.start, self.row_count)
+        self._table = None
+        if heading + rows > avail_height:
+            # Cannot fit; the frame will ask for a split
+            self.width, self.height = avail_width, heading + rows
+            return self.width, self.height
+        self._table = self.make_table(self.start, self.row_count)
+        _, table_height = self._table.wrap(avail_width, avail_height)
+        self.width, self.height = avail_width, heading + table_height
+        return self.width, self.height
+
+    def _fitting_rows(self, space):
+        # Largest k such that rows start..start+k-1 fit in space
+        return bisect_right(self._offsets, self._offsets[self.start] + space, lo=self.start) - 1 - self.start
+
+    def split(self, avail_width, avail_height):
+        self._measure(avail_width, avail_height)
+        space = avail_height - self._heading_height(avail_width, avail_height)
+        count = min(self._fitting_rows(space), self.row_count - self.start - 1)
+        table = None
+        while count > 0:
+            stop = self.start + count
+            table = self.make_table(self.start, stop)
+            _, height = table.wrap(avail_width, avail_height)
+            if height <= space:
+                break
+            # Header and trailing rows did not fit as well; retry with what is left for rows
+            overhead = height - self._rows_height(self.start, stop)
+            count = min(count - 1, self._fitting_rows(space - overhead))
+        if count <= 0:
+            # Not even one row fits here: move the heading along with the rows
+            return []
+        rest = PagedTable(self.make_table, self.row_count, start=self.start + count, _offsets=self._offsets)
+        return ([self.heading] if self.heading is not None else []) + [table, rest]
+
+    def drawOn(self, canvas, x, y, _sW=0):
+        # Laid out full width; the pieces align themselves
+        self.canv = canvas
+        top = y + self.height
+        if self.heading is not None:
+            _, heading_height = self.heading.wrap(self.width, self.height)
+            top -= heading_height
+            self.heading.drawOn(canvas, x, top)
+            top -= self.heading.getSpaceAfter()
+        table_width, table_height = self._table.wrap(self.width, self.height)
+        self._table.drawOn(canvas, x, top - table_height, _sW=self.width - table_width)
+        del self.canv
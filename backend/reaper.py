@@ -0,0 +1,87 @@
+import asyncio
+import logging
+from datetime import datetime, timezone, timedelta
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PURGED_DOCUMENTS = metrics.counter(
+    "trip_purge_deleted_total", "Child documents removed by the trip reaper", ["collection"]
+)
+PURGES_FINISHED = metrics.counter("trip_purges_finished_total", "Deleted trips fully purged by the reaper")
+
+# Collections whose documents belong to a trip through trip_id
+CHILD_COLLECTIONS = ("itineraries", "expenses")
+
+
+class TripReaper:
+    """Purges the itineraries and expenses of deleted trips in the background.
+
+    ``delete_trip`` removes the trip document and records a purge marker in
+    the same transaction, so the request costs two writes no matter how large
+    the trip is. The reaper deletes the children in batches and then drops the
+    marker. Markers survive restarts, so a purge interrupted by a crash is
+    resumed on the next pass.
+    """
+
+    def __init__(self, db, batch_size: int = 1000, interval: float = 60.0, grace_seconds: int = 300):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+        # A marker whose trip still exists is only discarded after this long, since on a
+        # standalone server the marker is written just before the trip is deleted
+        self.grace = timedelta(seconds=grace_seconds)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def wake(self):
+        self._wakeup.set()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Trip reaper pass failed")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+    async def run_once(self) -> int:
+        """Process every pending purge marker; returns the number of trips purged."""
+        purged = 0
+        async for marker in self.db.trip_purges.find({}, {"_id": 1, "trip_id": 1, "created_at": 1}).sort("created_at", 1):
+            if await self.db.trips.find_one({"id": marker["trip_id"]}, {"_id": 1}):
+                created = datetime.fromisoformat(marker["created_at"])
+                if datetime.now(timezone.utc) - created > self.grace:
+                    # The delete that wrote this marker never went through
+                    await self.db.trip_purges.delete_one({"_id": marker["_id"]})
+                continue
+            for name in CHILD_COLLECTIONS:
+                await self._purge(self.db[name], marker["trip_id"])
+            await self.db.trip_purges.delete_one({"_id": marker["_id"]})
+            PURGES_FINISHED.inc()
+            purged += 1
+        return purged
+
+    async def _purge(self, collection, trip_id: str):
+        while True:
+            ids = [doc["_id"] for doc in await collection.find(
+                {"trip_id": trip_id}, {"_id": 1}
+            ).limit(self.batch_size).to_list(self.batch_size)]
+            if not ids:
+                return
+            result = await collection.delete_many({"_id": {"$in": ids}})
+            PURGED_DOCUMENTS.inc(result.deleted_count, collection=collection.name)
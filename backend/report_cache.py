@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from typing import Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_LOOKUPS = metrics.counter("report_cache_lookups_total", "Report cache lookups by tier and result", ["tier", "result"])
+CACHE_EVICTIONS = metrics.counter("report_cache_evictions_total", "Report cache evictions by tier", ["tier"])
+
+
+def report_cache_key(format: str, data: dict, layout_version: str) -> str:
+    """Content hash of everything that ends up in a rendered report.
+
+    The render date is part of the key because the signature block prints
+    today's date; the layout version invalidates entries when builders change.
+    """
+    payload = {
+        "format": format,
+        "layout": layout_version,
+        "date": datetime.now().strftime("%Y-%m-%d"),
+        "user": data["user"],
+        "trip": data["trip"],
+        "itineraries": data["itineraries"],
+        "expenses": data["expenses"],
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class MemoryTier:
+    def __init__(self, max_items: int, max_bytes: int):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._items = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: str) -> Optional[bytes]:
+        content = self._items.get(key)
+        if content is not None:
+            self._items.move_to_end(key)
+        return content
+
+    def put(self, key: str, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        if key in self._items:
+            self._bytes -= len(self._items.pop(key))
+        self._items[key] = content
+        self._bytes += len(content)
+        while len(self._items) > self.max_items or self._bytes > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self._bytes -= len(evicted)
+            CACHE_EVICTIONS.inc(tier="memory")
+
+
+class DiskTier:
+    """Files named by key under ``directory``; least recently used (by mtime) go first."""
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._bytes = sum(p.stat().st_size for p in self.directory.glob("*.bin"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / f"{key}.bin"
+
+    def get(self, key: str) -> Optional[bytes]:
+        path = self._path(key)
+        try:
+            content = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return content
+
+    def put(self, key: str, content: bytes):
+        if len(content) > self.max_bytes:
+            return
+        path = self._path(key)
+        tmp = path.with_suffix(f".{threading.get_ident()}.tmp")
+        tmp.write_bytes(content)
+        with self._lock:
+            previous = path.stat().st_size if path.exists() else 0
+            os.replace(tmp, path)
+            self._bytes += len(content) - previous
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = []
+        for p in self.directory.glob("*.bin"):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+        entries.sort()
+        self._bytes = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if self._bytes <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                continue
+            self._bytes -= size
+            CACHE_EVICTIONS.inc(tier="disk")
+
+
+class ReportCache:
+    """Two-tier (memory LRU, then disk) cache of rendered report bytes."""
+
+    def __init__(self, directory: Path, memory_items: int = 64, memory_bytes: int = 64 * 1024 * 1024,
+                 disk_bytes: int = 512 * 1024 * 1024):
+        self.memory = MemoryTier(memory_items, memory_bytes)
+        self.disk = DiskTier(directory, disk_bytes) if disk_bytes > 0 else None
+
+    async def get(self, key: str) -> Optional[bytes]:
+        content = self.memory.get(key)
+        if content is not None:
+            CACHE_LOOKUPS.inc(tier="memory", result="hit")
+            return content
+        CACHE_LOOKUPS.inc(tier="memory", result="miss")
+        if self.disk is None:
+            return None
+
+        try:
+            content = await asyncio.to_thread(self.disk.get, key)
+        except OSError as e:
+            logger.warning(f"Report cache read failed for {key}: {e}")
+            content = None
+        if content is None:
+            CACHE_LOOKUPS.inc(tier="disk", result="miss")
+            return None
+        CACHE_LOOKUPS.inc(tier="disk", result="hit")
+        self.memory.put(key, content)
+        return content
+
+    async def put(self, key: str, content: bytes):
+        self.memory.put(key, content)
+        if self.disk is None:
+            return
+        try:
+            await asyncio.to_thread(self.disk.put, key, content)
+        except OSError as e:
+            logger.warning(f"Report cache write failed for {key}: {e}")
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from fastapi import HTTPException
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOBS_SUBMITTED = metrics.counter("report_jobs_submitted_total", "Report jobs accepted", ["format"])
+JOBS_FINISHED = metrics.counter("report_jobs_finished_total", "Report jobs finished by outcome", ["format", "status"])
+
+# Fields returned by the status endpoint; payload and content stay in Mongo
+JOB_STATUS_PROJECTION = {"_id": 0, "payload": 0, "content": 0}
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class ReportJobQueue:
+    """Report jobs persisted in Mongo and rendered by a pool of local workers.
+
+    A job document carries the report payload captured at submission, so jobs
+    still queued or running when the process stops are picked up again by
+    ``start``. Workers claim a job atomically (queued -> running) before
+    rendering it, so several server processes can share one collection.
+
+    A running or queued job is only taken back once its ``updated_at`` is
+    older than ``stale_seconds``, i.e. longer than any live worker would take
+    to finish or fail it, so jobs other processes are still rendering are left
+    alone. A watcher repeats this while the queue runs.
+    """
+
+    def __init__(self, collection, render, workers: int = 2, max_queue: int = 100, ttl_hours: int = 24,
+                 stale_seconds: float = 120.0):
+        self.collection = collection
+        self.render = render
+        self.workers = workers
+        self.ttl = timedelta(hours=ttl_hours)
+        self.stale = timedelta(seconds=stale_seconds)
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        # Queue slots promised to submissions still waiting on their insert
+        self._reserved = 0
+        self._tasks = []
+
+    async def start(self):
+        # Recently queued jobs first; older ones and stale running ones are reclaim_stale's
+        cutoff = (datetime.now(timezone.utc) - self.stale).isoformat()
+        queued = await self.collection.find(
+            {"status": "queued", "updated_at": {"$gte": cutoff}}, {"_id": 0, "id": 1}
+        ).sort("created_at", 1).to_list(self._free_slots())
+        for job in queued:
+            self._queue.put_nowait(job["id"])
+        if queued:
+            logger.info(f"Queued {len(queued)} unfinished report jobs")
+        await self.reclaim_stale()
+        self._tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._watch()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def _free_slots(self) -> int:
+        return self._queue.maxsize - self._queue.qsize() - self._reserved
+
+    async def reclaim_stale(self) -> int:
+        """Queue jobs nobody is working on: running jobs whose worker stopped updating
+        them and queued jobs left waiting, e.g. in the memory of a crashed process."""
+        if self._free_slots() <= 0:
+            return 0
+        cutoff = (datetime.now(timezone.utc) - self.stale).isoformat()
+        stale = {"status": {"$in": ["queued", "running"]}, "updated_at": {"$lt": cutoff}}
+        jobs = await self.collection.find(stale, {"_id": 0, "id": 1}).sort("created_at", 1).to_list(self._free_slots())
+        if not jobs:
+            return 0
+        ids = [j["id"] for j in jobs]
+        # Refreshing updated_at keeps the next pass from queueing them again while they wait here;
+        # a job queued twice is harmless, since _run claims it atomically
+        await self.collection.update_many(
+            {**stale, "id": {"$in": ids}},
+            {"$set": {"status": "queued", "updated_at": datetime.now(timezone.utc).isoformat()}}
+        )
+        for job_id in ids:
+            if self._free_slots() <= 0:
+                break  # picked up again by a later pass
+            self._queue.put_nowait(job_id)
+        logger.info(f"Re-queued {len(ids)} stale report jobs")
+        return len(ids)
+
+    async def _watch(self):
+        # Jobs orphaned by a process that died after this one started, or not queued for lack of room
+        while True:
+            await asyncio.sleep(self.stale.total_seconds())
+            try:
+                await self.reclaim_stale()
+            except Exception:
+                logger.exception("Reclaiming stale report jobs failed")
+
+    async def submit(self, trip_id: str, user_id: str, format: str, payload: dict,
+                     filename: Optional[str] = None) -> dict:
+        if self._free_slots() <= 0:
+            raise JobQueueFullError(f"report job queue full ({self._queue.qsize()} waiting)")
+
+        # Hold the slot across the insert so concurrent submissions cannot overfill the queue
+        self._reserved += 1
+        now = datetime.now(timezone.utc)
+        job = {
+            "id": str(uuid.uuid4()),
+            "trip_id": trip_id,
+            "user_id": user_id,
+            "format": format,
+            "filename": filename,
+            "status": "queued",
+            "error": None,
+            "size": None,
+            "created_at": now.isoformat(),
+            "updated_at": now.isoformat(),
+            "expires_at": now + self.ttl,
+        }
+        try:
+            await self.collection.insert_one({**job, "payload": payload})
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job["id"])
+        JOBS_SUBMITTED.inc(format=format)
+        job.pop("expires_at")
+        return job
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except Exception:
+                logger.exception(f"Report job {job_id} crashed")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        job = await self.collection.find_one_and_update(
+            {"id": job_id, "status": "queued"},
+            {"$set": {"status": "running", "updated_at": datetime.now(timezone.utc).isoformat()}},
+            projection={"_id": 0, "format": 1, "payload": 1},
+        )
+        if job is None:
+            # Already claimed by another process or expired
+            return
+
+        update = {"updated_at": None}
+        try:
+            content = await self.render(job["format"], job["payload"])
+        except HTTPException as e:
+            update.update({"status": "failed", "error": e.detail})
+        except Exception as e:
+            logger.exception(f"Report job {job_id} failed")
+            update.update({"status": "failed", "error": str(e) or type(e).__name__})
+        else:
+            update.update({"status": "done", "content": content, "size": len(content)})
+
+        update["updated_at"] = datetime.now(timezone.utc).isoformat()
+        await self.collection.update_one({"id": job_id}, {"$set": update, "$unset": {"payload": ""}})
+        JOBS_FINISHED.inc(format=job["format"], status=update["status"])
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TEMPLATE = "default"
+
+# Template options by name. Worker processes are spawned and start from a fresh
+# registry, so templates outside the default come from REPORT_TEMPLATES_FILE,
+# which every process loads on first use.
+_options = {DEFAULT_TEMPLATE: {"letterhead": [], "units": []}}
+_built = {}
+_lock = threading.RLock()
+_file_loaded = False
+
+
+class PdfTemplate:
+    """ReportLab styles for one named template, built once per process and shared read-only."""
+
+    def __init__(self, name: str, letterhead=()):
+        from reportlab.lib import colors
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.enums import TA_CENTER
+        from reportlab.platypus import TableStyle
+
+        self.name = name
+        self.letterhead = list(letterhead)
+
+        styles = getSampleStyleSheet()
+        self.title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=14, alignment=TA_CENTER, spaceAfter=12)
+        self.subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=11, alignment=TA_CENTER, spaceAfter=24)
+        self.heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=11, spaceAfter=8, spaceBefore=16)
+        self.normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10)
+        self.letterhead_style = ParagraphStyle('Letterhead', parent=styles['Normal'], fontSize=12, leading=15,
+                                               alignment=TA_CENTER, fontName='Helvetica-Bold')
+
+        self.letterhead_table = TableStyle([
+            ('LINEBELOW', (0, -1), (-1, -1), 1.5, colors.black),
+            ('BOTTOMPADDING', (0, -1), (-1, -1), 6),
+        ])
+        self.info_table = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ])
+        self.itinerary_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.9, 0.9, 0.9)),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+        ])
+        self.expense_table = TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.9, 0.9, 0.9)),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+            ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
+            ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
+            ('BACKGROUND', (0, -1), (-1, -1), colors.Color(0.95, 0.95, 0.95)),
+        ])
+        self.expense_subtotal_table = TableStyle([
+            ('FONTNAME', (2, -2), (-1, -2), 'Helvetica-Bold'),
+        ])
+        self.signature_table = TableStyle([
+            ('FONTSIZE', (0, 0), (-1, -1), 10),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ])
+
+
+def register_template(name: str, letterhead=(), units=()):
+    """Declare a named template, e.g. an agency letterhead used for the given units."""
+    with _lock:
+        _options[name] = {"letterhead": list(letterhead), "units": list(units)}
+        _built.pop(name, None)
+
+
+def _load_configured():
+    global _file_loaded
+    if _file_loaded:
+        return
+    with _lock:
+        if not _file_loaded:
+            path = os.environ.get('REPORT_TEMPLATES_FILE')
+            if path:
+                load_templates_file(path)
+            _file_loaded = True
+
+
+def get_template(name: str = DEFAULT_TEMPLATE) -> PdfTemplate:
+    template = _built.get(name)
+    if template is not None:
+        return template
+    _load_configured()
+    with _lock:
+        template = _built.get(name)
+        if template is None:
+            options = _options.get(name)
+            if options is None:
+                raise KeyError(f"Unknown report template: {name}")
+            template = _built[name] = PdfTemplate(name, options["letterhead"])
+    return template
+
+
+def template_names():
+    _load_configured()
+    return list(_options)
+
+
+def template_for_unit(unit: str) -> str:
+    _load_configured()
+    for name, options in _options.items():
+        if unit and unit in options["units"]:
+            return name
+    return DEFAULT_TEMPLATE
+
+
+def template_fingerprint(name: str) -> str:
+    # Part of the report cache key, so editing a letterhead invalidates cached PDFs
+    _load_configured()
+    options = _options.get(name, {})
+    encoded = json.dumps([name, options.get("letterhead", [])], separators=(",", ":")).encode()
+    return hashlib.sha256(encoded).hexdigest()[:12]
+
+
+def load_templates_file(path: str):
+    """Register templates from a JSON file: {"name": {"letterhead": [...], "units": [...]}}."""
+    with open(path, encoding="utf-8") as f:
+        templates = json.load(f)
+    for name, options in templates.items():
+        register_template(name, options.get("letterhead", []), options.get("units", []))
+    logger.info(f"Loaded {len(templates)} report templates from {path}")
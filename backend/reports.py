@@ -0,0 +1,400 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+from report_templates import DEFAULT_TEMPLATE, get_template, template_fingerprint, template_names
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever a builder's output changes so cached reports are not reused
+LAYOUT_VERSION = 4
+
+MEDIA_TYPES = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+
+RENDER_DURATION_SECONDS = metrics.histogram(
+    "report_render_duration_seconds", "Wall time from submission to rendered report bytes", ["format"]
+)
+RENDER_SIZE_BYTES = metrics.histogram(
+    "report_render_size_bytes", "Size of rendered reports", ["format"],
+    buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6),
+)
+RENDER_REJECTED = metrics.counter(
+    "report_render_rejected_total", "Report renders rejected because the submission queue was full", ["format"]
+)
+RENDER_TIMEOUTS = metrics.counter(
+    "report_render_timeouts_total", "Report renders that exceeded the per-job timeout", ["format"]
+)
+RENDER_POOL_RESTARTS = metrics.counter(
+    "report_render_pool_restarts_total", "Render process pools discarded after a worker died"
+)
+
+
+class RendererBusyError(Exception):
+    pass
+
+
+class RenderTimeoutError(Exception):
+    pass
+
+
+def layout_key(data: dict) -> str:
+    # Cache key component: builder layout plus the letterhead of the chosen template
+    name = data.get("template") or DEFAULT_TEMPLATE
+    return f"{LAYOUT_VERSION}:{name}:{template_fingerprint(name)}"
+
+
+def report_filename(trip: dict, format: str) -> str:
+    return f"laporan_perjalanan_{trip['judul'].replace(' ', '_')}.{format}"
+
+
+# ============ BUILDERS ============
+
+def build_pdf(data: dict) -> bytes:
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table
+    from pdf_tables import PagedTable
+    
+    template = get_template(data.get("template") or DEFAULT_TEMPLATE)
+    title_style = template.title_style
+    subtitle_style = template.subtitle_style
+    heading_style = template.heading_style
+    
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
+    
+    elements = []
+    
+    # Letterhead
+    if template.letterhead:
+        letterhead_table = Table([[Paragraph(line, template.letterhead_style)] for line in template.letterhead],
+                                 colWidths=[17*cm])
+        letterhead_table.setStyle(template.letterhead_table)
+        elements.append(letterhead_table)
+        elements.append(Spacer(1, 0.5*cm))
+    
+    # Header
+    elements.append(Paragraph("LAPORAN PERJALANAN DINAS", title_style))
+    elements.append(Paragraph(f"Nomor: -", subtitle_style))
+    
+    # Trip Info
+    trip = data["trip"]
+    user = data["user"]
+    
+    info_data = [
+        ["Nama", ":", user["full_name"]],
+        ["NIP", ":", user["nip"]],
+        ["Jabatan", ":", user["jabatan"]],
+        ["Unit/Bagian", ":", user["unit"]],
+        ["", "", ""],
+        ["Judul Perjalanan", ":", trip["judul"]],
+        ["Tujuan", ":", trip["tujuan"]],
+        ["Tanggal", ":", f"{trip['tanggal_mulai']} s.d. {trip['tanggal_selesai']}"],
+        ["Dasar Perjalanan", ":", trip["dasar_perjalanan"]],
+        ["Maksud dan Tujuan", ":", trip["maksud_tujuan"]],
+    ]
+    
+    info_table = Table(info_data, colWidths=[4*cm, 0.5*cm, 10*cm])
+    info_table.setStyle(template.info_table)
+    elements.append(info_table)
+    elements.append(Spacer(1, 0.5*cm))
+    
+    # Itinerary Section
+    # Long lists go in PagedTables: one Table per page, each with its own header row,
+    # sized to the space left in the frame and keeping the section heading with the first rows
+    itinerary_header = ["No", "Tanggal", "Waktu", "Kegiatan", "Lokasi"]
+    itinerary_rows = [
+        [str(i+1), it["tanggal"], it["waktu"], it["kegiatan"], it["lokasi"]]
+        for i, it in enumerate(data["itineraries"])
+    ]
+    
+    def itinerary_table(start, stop):
+        table = Table([itinerary_header] + itinerary_rows[start:stop], colWidths=[1*cm, 2.5*cm, 1.5*cm, 7*cm, 3*cm])
+        table.setStyle(template.itinerary_table)
+        return table
+    
+    elements.append(PagedTable(itinerary_table, len(itinerary_rows), Paragraph("I. URAIAN KEGIATAN", heading_style)))
+    elements.append(Spacer(1, 0.5*cm))
+    
+    # Expense Section
+    def format_rupiah(amount):
+        return f"Rp {amount:,.0f}".replace(",", ".")
+    
+    expense_header = ["No", "Tanggal", "Uraian", "Jumlah (Rp)"]
+    expenses = data["expenses"]
+    expense_rows = [
+        [str(exp["nomor"]), exp["tanggal"], exp["uraian"], format_rupiah(exp["jumlah"])]
+        for exp in expenses
+    ]
+    running_totals = [0]
+    for exp in expenses:
+        running_totals.append(running_totals[-1] + exp["jumlah"])
+    
+    def expense_table(start, stop):
+        expense_data = [expense_header] + expense_rows[start:stop]
+        paged = start > 0 or stop < len(expense_rows)
+        if paged:
+            # Page subtotal, then the running total (the grand total on the last page)
+            expense_data.append(["", "", "Subtotal halaman", format_rupiah(running_totals[stop] - running_totals[start])])
+        if stop < len(expense_rows):
+            expense_data.append(["", "", "Jumlah s.d. halaman ini", format_rupiah(running_totals[stop])])
+        else:
+            expense_data.append(["", "", "TOTAL", format_rupiah(data["total_expense"])])
+        
+        table = Table(expense_data, colWidths=[1*cm, 2.5*cm, 8*cm, 3.5*cm])
+        table.setStyle(template.expense_table)
+        if paged:
+            table.setStyle(template.expense_subtotal_table)
+        return table
+    
+    elements.append(PagedTable(expense_table, len(expense_rows), Paragraph("II. RINCIAN BIAYA", heading_style)))
+    elements.append(Spacer(1, 1.5*cm))
+    
+    # Signature Section
+    from datetime import datetime
+    today = datetime.now().strftime("%d-%m-%Y")
+    
+    signature_data = [
+        ["", f"__________, {today}"],
+        ["Mengetahui,", "Yang Membuat Laporan,"],
+        ["Atasan Langsung", ""],
+        ["", ""],
+        ["", ""],
+        ["", ""],
+        ["(_________________)", f"({user['full_name']})"],
+        ["NIP.", f"NIP. {user['nip']}"],
+    ]
+    
+    sig_table = Table(signature_data, colWidths=[7.5*cm, 7.5*cm])
+    sig_table.setStyle(template.signature_table)
+    elements.append(sig_table)
+    
+    doc.build(elements)
+    return buffer.getvalue()
+
+def _xlsx_named_styles():
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
+    
+    title_font = Font(bold=True, size=14)
+    header_font = Font(bold=True, size=11)
+    thin_border = Border(
+        left=Side(style='thin'),
+        right=Side(style='thin'),
+        top=Side(style='thin'),
+        bottom=Side(style='thin')
+    )
+    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
+    
+    return [
+        NamedStyle("laporan_title", font=title_font, alignment=Alignment(horizontal='center')),
+        NamedStyle("laporan_section", font=header_font),
+        NamedStyle("laporan_header", font=header_font, fill=header_fill, border=thin_border,
+                   alignment=Alignment(horizontal='center')),
+        NamedStyle("laporan_cell", border=thin_border),
+        NamedStyle("laporan_amount", border=thin_border, number_format='#,##0'),
+        NamedStyle("laporan_total_label", font=header_font, border=thin_border),
+        NamedStyle("laporan_total", font=header_font, border=thin_border, number_format='#,##0'),
+    ]
+
+
+def build_xlsx(data: dict) -> bytes:
+    """Build the XLSX report with openpyxl's write-only workbook.
+    
+    Rows are streamed straight to the sheet XML and every cell references one
+    of a handful of named styles, so memory stays flat with the row count.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    
+    wb = Workbook(write_only=True)
+    for style in _xlsx_named_styles():
+        wb.add_named_style(style)
+    ws = wb.create_sheet("Laporan Perjalanan")
+    
+    trip = data["trip"]
+    user = data["user"]
+    
+    def styled(value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+    
+    # Column widths and merges must be declared before the first row is written
+    ws.column_dimensions['A'].width = 5
+    ws.column_dimensions['B'].width = 12
+    ws.column_dimensions['C'].width = 40
+    ws.column_dimensions['D'].width = 15
+    ws.column_dimensions['E'].width = 15
+    ws.merged_cells.add('A1:F1')
+    
+    # Title
+    ws.append([styled("LAPORAN PERJALANAN DINAS", "laporan_title")])
+    ws.append([])
+    
+    # Info Section
+    info = [
+        ("Nama", user["full_name"]),
+        ("NIP", user["nip"]),
+        ("Jabatan", user["jabatan"]),
+        ("Unit/Bagian", user["unit"]),
+        ("", ""),
+        ("Judul Perjalanan", trip["judul"]),
+        ("Tujuan", trip["tujuan"]),
+        ("Tanggal", f"{trip['tanggal_mulai']} s.d. {trip['tanggal_selesai']}"),
+        ("Dasar Perjalanan", trip["dasar_perjalanan"]),
+        ("Maksud dan Tujuan", trip["maksud_tujuan"]),
+    ]
+    for label, value in info:
+        ws.append([label, ":", value])
+    
+    # Itinerary Section
+    ws.append([])
+    ws.append([styled("I. URAIAN KEGIATAN", "laporan_section")])
+    ws.append([styled(h, "laporan_header") for h in ["No", "Tanggal", "Waktu", "Kegiatan", "Lokasi"]])
+    for i, it in enumerate(data["itineraries"], 1):
+        ws.append([
+            styled(i, "laporan_cell"),
+            styled(it["tanggal"], "laporan_cell"),
+            styled(it["waktu"], "laporan_cell"),
+            styled(it["kegiatan"], "laporan_cell"),
+            styled(it["lokasi"], "laporan_cell"),
+        ])
+    
+    # Expense Section
+    ws.append([])
+    ws.append([styled("II. RINCIAN BIAYA", "laporan_section")])
+    ws.append([styled(h, "laporan_header") for h in ["No", "Tanggal", "Uraian", "Jumlah (Rp)"]])
+    for exp in data["expenses"]:
+        ws.append([
+            styled(exp["nomor"], "laporan_cell"),
+            styled(exp["tanggal"], "laporan_cell"),
+            styled(exp["uraian"], "laporan_cell"),
+            styled(exp["jumlah"], "laporan_amount"),
+        ])
+    
+    # Total
+    ws.append([None, None, styled("TOTAL", "laporan_total_label"), styled(data["total_expense"], "laporan_total")])
+    
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+BUILDERS = {
+    "pdf": build_pdf,
+    "xlsx": build_xlsx,
+}
+
+
+def render(format: str, data: dict) -> bytes:
+    return BUILDERS[format](data)
+
+
+# ============ PROCESS POOL ============
+
+def _warm_worker():
+    # Pay the ReportLab/openpyxl import and template setup cost once per worker, not per job
+    import reportlab.platypus  # noqa: F401
+    import openpyxl  # noqa: F401
+    for name in template_names():
+        get_template(name)
+
+
+def _noop():
+    return None
+
+
+class ReportRenderer:
+    """Renders reports in a pool of worker processes.
+
+    At most ``max_workers + max_queue`` jobs may be outstanding; further
+    submissions raise ``RendererBusyError``. A job that does not finish within
+    ``timeout`` seconds raises ``RenderTimeoutError`` to the caller (the worker
+    itself keeps running until the build returns, and keeps its slot until then).
+    If a worker dies the pool is replaced on the next call and the jobs it
+    took down raise ``RendererBusyError``.
+    """
+
+    def __init__(self, max_workers: int = 2, max_queue: int = 16, timeout: float = 60.0):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._pending = 0
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.max_workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        return self._executor
+
+    async def start(self):
+        """Spawn and warm every worker up front so the first report is not slow."""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(executor, _noop) for _ in range(self.max_workers)))
+
+    def _discard_executor(self, executor):
+        # A worker died (e.g. OOM-killed) and the pool refuses all further work; the next
+        # render spawns a fresh one. Only the first caller to notice tears it down.
+        if self._executor is executor:
+            logger.error("Report render worker died; restarting the process pool")
+            RENDER_POOL_RESTARTS.inc()
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _release(self):
+        self._pending -= 1
+
+    def _release_from(self, loop):
+        # Runs on the executor's thread when the worker finishes
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:
+            pass  # loop already closed at shutdown
+
+    async def render(self, format: str, data: dict) -> bytes:
+        if format not in BUILDERS:
+            raise ValueError(f"Unknown report format: {format}")
+        if self._pending >= self.max_workers + self.max_queue:
+            RENDER_REJECTED.inc(format=format)
+            raise RendererBusyError(f"report queue full ({self._pending} pending)")
+
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            job = executor.submit(render, format, data)
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise RendererBusyError("report worker pool restarting")
+        # The slot is held until the worker is done, not until the caller stops waiting
+        self._pending += 1
+        job.add_done_callback(lambda _: self._release_from(loop))
+        try:
+            content = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(job)), self.timeout)
+        except asyncio.TimeoutError:
+            RENDER_TIMEOUTS.inc(format=format)
+            logger.error(f"Report render ({format}) timed out after {self.timeout}s")
+            raise RenderTimeoutError(f"report render exceeded {self.timeout}s")
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise RendererBusyError("report worker died during render")
+        RENDER_DURATION_SECONDS.observe(time.perf_counter() - started, format=format)
+        RENDER_SIZE_BYTES.observe(len(content), format=format)
+        return content
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -1,26 +1,52 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, File, Header, Query, UploadFile, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import StreamingResponse
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateMany, UpdateOne
 import os
 import logging
 from pathlib import Path
-from pydantic import BaseModel, Field, EmailStr
+from pydantic import BaseModel, Field, EmailStr, ValidationError
 from typing import List, Optional
+import asyncio
+import base64
+import csv
+import hashlib
+import io
+import json
+import re
 import uuid
 from datetime import datetime, timezone, timedelta
+from email.utils import format_datetime
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-import io
+
+import metrics
+from aggregates import stored_totals, seed_trip_aggregates, COUNTERS_MISSING, COUNTERS_PRESENT, TRIP_COUNTER_FIELDS
+from artifacts import ArtifactStore, RangeNotSatisfiableError, data_version, parse_range
+from hashing import HashingBusyError, PasswordHasher
+from importer import ImportFormatError, detect_format, iter_chunks, iter_csv_rows, iter_xlsx_rows
+from indexes import ensure_indexes
+from observability import EventLoopLagMonitor, MongoCommandMetrics, RequestMetricsMiddleware
+from reaper import TripReaper
+from report_jobs import JOB_STATUS_PROJECTION, JobQueueFullError, ReportJobQueue
+from report_cache import ReportCache, report_cache_key
+from report_templates import template_for_unit
+from reports import MEDIA_TYPES, RendererBusyError, RenderTimeoutError, ReportRenderer, layout_key, report_filename
+from singleflight import SingleFlight
+from transactions import LeaseTimeoutError, run_in_transaction, run_serialized
+from ttlcache import TTLCache
+from zipstream import stream_zip
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[MongoCommandMetrics()])
 db = client[os.environ['DB_NAME']]
 
 # JWT Config
@@ -30,8 +56,42 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+password_hasher = PasswordHasher(
+    pwd_context,
+    max_workers=int(os.environ.get('HASH_MAX_WORKERS', '4')),
+    max_queue=int(os.environ.get('HASH_MAX_QUEUE', '64')),
+)
 security = HTTPBearer()
 
+# Authenticated users by id, without the password hash. Per process, so other
+# workers only see profile changes once the TTL runs out.
+user_cache = TTLCache(
+    max_size=int(os.environ.get('USER_CACHE_MAX_SIZE', '10000')),
+    ttl=float(os.environ.get('USER_CACHE_TTL_SECONDS', '60')),
+)
+USER_CACHE_LOOKUPS = metrics.counter("user_cache_lookups_total", "get_current_user cache lookups", ["result"])
+
+# Report rendering runs in worker processes so builds never block the event loop
+report_renderer = ReportRenderer(
+    max_workers=int(os.environ.get('REPORT_WORKERS', '2')),
+    max_queue=int(os.environ.get('REPORT_MAX_QUEUE', '16')),
+    timeout=float(os.environ.get('REPORT_TIMEOUT_SECONDS', '60')),
+)
+
+# Rendered reports keyed by a hash of their input data; any edit changes the key
+report_cache = ReportCache(
+    Path(os.environ.get('REPORT_CACHE_DIR', str(ROOT_DIR / '.report_cache'))),
+    memory_items=int(os.environ.get('REPORT_CACHE_MEMORY_ITEMS', '64')),
+    memory_bytes=int(os.environ.get('REPORT_CACHE_MEMORY_MB', '64')) * 1024 * 1024,
+    disk_bytes=int(os.environ.get('REPORT_CACHE_DISK_MB', '512')) * 1024 * 1024,
+)
+# Concurrent requests for the same report share a single render
+report_flights = SingleFlight("report_render")
+
+# Reports of completed trips, archived once per data version in GridFS
+report_artifacts = ArtifactStore(db)
+artifact_flights = SingleFlight("report_artifact")
+
 app = FastAPI()
 api_router = APIRouter(prefix="/api")
 
@@ -89,6 +149,29 @@ class TripResponse(BaseModel):
     maksud_tujuan: str
     status: str
     created_at: str
+    updated_at: Optional[str] = None
+    version: int = 0
+    expense_total: float = 0
+    expense_count: int = 0
+    itinerary_count: int = 0
+
+class TripListItem(BaseModel):
+    # Every field optional so ?fields= projections validate; unset ones are dropped
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    judul: Optional[str] = None
+    tujuan: Optional[str] = None
+    tanggal_mulai: Optional[str] = None
+    tanggal_selesai: Optional[str] = None
+    dasar_perjalanan: Optional[str] = None
+    maksud_tujuan: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[str] = None
+    updated_at: Optional[str] = None
+    version: Optional[int] = None
+    expense_total: Optional[float] = None
+    expense_count: Optional[int] = None
+    itinerary_count: Optional[int] = None
 
 class ItineraryCreate(BaseModel):
     tanggal: str
@@ -112,6 +195,7 @@ class ItineraryResponse(BaseModel):
     kegiatan: str
     lokasi: str
     catatan: str
+    updated_at: Optional[str] = None
 
 class ExpenseCreate(BaseModel):
     tanggal: str
@@ -133,14 +217,53 @@ class ExpenseResponse(BaseModel):
     uraian: str
     jumlah: float
     catatan: str
+    updated_at: Optional[str] = None
+
+class BatchRequest(BaseModel):
+    # Items are validated one by one so a bad row is reported instead of failing the batch
+    create: List[dict] = []
+    update: List[dict] = []
+    delete: List[str] = []
+
+class ReportJobResponse(BaseModel):
+    id: str
+    trip_id: str
+    format: str
+    status: str
+    error: Optional[str] = None
+    size: Optional[int] = None
+    created_at: str
+    updated_at: str
+
+class ReportArtifactResponse(BaseModel):
+    id: str
+    format: str
+    filename: str
+    size: int
+    data_version: str
+    created_at: str
+
+class ReportExportRequest(BaseModel):
+    format: str = "pdf"
+    trip_ids: Optional[List[str]] = None
+    status: Optional[str] = None
+    tujuan: Optional[str] = None
+    dari_tanggal: Optional[str] = None
+    sampai_tanggal: Optional[str] = None
 
 # ============ AUTH HELPERS ============
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
+async def verify_password(plain_password, hashed_password):
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HashingBusyError:
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
 
-def get_password_hash(password):
-    return pwd_context.hash(password)
+async def get_password_hash(password):
+    try:
+        return await password_hasher.hash(password)
+    except HashingBusyError:
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
 
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -164,10 +287,17 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user = await db.users.find_one({"id": user_id}, {"_id": 0})
+    user = user_cache.get(user_id)
+    if user is not None:
+        USER_CACHE_LOOKUPS.inc(result="hit")
+        return dict(user)
+    
+    USER_CACHE_LOOKUPS.inc(result="miss")
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password": 0})
     if user is None:
         raise credentials_exception
-    return user
+    user_cache.set(user_id, user)
+    return dict(user)
 
 # ============ AUTH ROUTES ============
 
@@ -181,7 +311,7 @@ async def register(user: UserRegister):
     user_doc = {
         "id": user_id,
         "email": user.email,
-        "password": get_password_hash(user.password),
+        "password": await get_password_hash(user.password),
         "full_name": user.full_name,
         "nip": "",
         "jabatan": "",
@@ -204,7 +334,7 @@ async def register(user: UserRegister):
 @api_router.post("/auth/login")
 async def login(user: UserLogin):
     db_user = await db.users.find_one({"email": user.email}, {"_id": 0})
-    if not db_user or not verify_password(user.password, db_user["password"]):
+    if not db_user or not await verify_password(user.password, db_user["password"]):
         raise HTTPException(status_code=401, detail="Email atau password salah")
     
     token = create_access_token({"sub": db_user["id"]})
@@ -243,6 +373,7 @@ async def update_profile(profile: UserProfile, current_user: dict = Depends(get_
             "unit": profile.unit
         }}
     )
+    user_cache.invalidate(current_user["id"])
     profile_completed = bool(profile.nip and profile.jabatan and profile.unit)
     return {
         "id": current_user["id"],
@@ -254,6 +385,126 @@ async def update_profile(profile: UserProfile, current_user: dict = Depends(get_
         "profile_completed": profile_completed
     }
 
+# ============ TRIP VERSIONS ============
+
+def trip_touch(inc: Optional[dict] = None, set_fields: Optional[dict] = None) -> dict:
+    # Update document for any change to a trip or its children: bumps the version behind the ETags
+    return {
+        "$inc": {**(inc or {}), "version": 1},
+        "$set": {**(set_fields or {}), "updated_at": datetime.now(timezone.utc).isoformat()},
+    }
+
+async def touch_trip(trip_id: str, inc: Optional[dict] = None, set_fields: Optional[dict] = None, session=None):
+    # Called after the child write; counters are only incremented on trips that already carry them
+    inc = {k: v for k, v in (inc or {}).items() if v}
+    query = {"id": trip_id}
+    if any(field in TRIP_COUNTER_FIELDS for field in inc):
+        query.update(COUNTERS_PRESENT)
+    result = await db.trips.update_one(query, trip_touch(inc, set_fields), session=session)
+    if not result.matched_count and len(query) > 1:
+        # Legacy trip: seeding counts the rows as they are now, this change included
+        await seed_trip_aggregates(db, [trip_id], session)
+        await db.trips.update_one({"id": trip_id}, trip_touch(None, set_fields), session=session)
+
+async def trip_version(trip_id: str, user_id: str) -> dict:
+    version = await db.trips.find_one(
+        {"id": trip_id, "user_id": user_id}, {"_id": 0, "id": 1, "version": 1, "updated_at": 1, "created_at": 1}
+    )
+    if not version:
+        raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+    return version
+
+def trip_validators(trip: dict, *parts) -> dict:
+    # Strong ETag over the trip version plus whatever else the representation depends on
+    key = "|".join(str(p) for p in (trip["id"], trip.get("version", 0), *parts))
+    modified = datetime.fromisoformat(trip.get("updated_at") or trip["created_at"])
+    return {
+        "ETag": f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"',
+        "Last-Modified": format_datetime(modified.astimezone(timezone.utc), usegmt=True),
+        "Cache-Control": "private, no-cache",
+    }
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
+
+def not_modified(validators: dict) -> Response:
+    return Response(status_code=304, headers=validators)
+
+# ============ SYNC ============
+
+# Deletions are kept this long; clients with an older cursor get a full reset
+SYNC_TOMBSTONE_DAYS = int(os.environ.get('SYNC_TOMBSTONE_DAYS', '30'))
+# Re-scan window behind the cursor, covering writes that committed after a later timestamp was read
+SYNC_OVERLAP_SECONDS = int(os.environ.get('SYNC_OVERLAP_SECONDS', '60'))
+SYNC_KINDS = ("trips", "itineraries", "expenses")
+
+async def record_tombstones(kind: str, trip_id: str, user_id: str, ids: List[str], session=None):
+    now = datetime.now(timezone.utc)
+    await db.tombstones.insert_many([
+        {
+            "kind": kind,
+            "id": item_id,
+            "trip_id": trip_id,
+            "user_id": user_id,
+            "deleted_at": now.isoformat(),
+            "expires_at": now + timedelta(days=SYNC_TOMBSTONE_DAYS),
+        }
+        for item_id in ids
+    ], session=session)
+
+def encode_sync_cursor(at: datetime) -> str:
+    return base64.urlsafe_b64encode(at.isoformat().encode()).decode()
+
+def decode_sync_cursor(cursor: str) -> datetime:
+    try:
+        at = datetime.fromisoformat(base64.urlsafe_b64decode(cursor.encode()).decode())
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    if at.tzinfo is None:
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    return at
+
+@api_router.get("/sync")
+async def sync_changes(since: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    # Everything changed or deleted since the cursor; without one (or with one older than the
+    # tombstones) the full data set is returned with reset=true and replaces the client's copy
+    started = datetime.now(timezone.utc)
+    user_id = current_user["id"]
+    since_at = decode_sync_cursor(since) if since else None
+    if since_at and since_at < started - timedelta(days=SYNC_TOMBSTONE_DAYS):
+        since_at = None
+    
+    changed = {}
+    if since_at:
+        changed = {"updated_at": {"$gte": (since_at - timedelta(seconds=SYNC_OVERLAP_SECONDS)).isoformat()}}
+    
+    trip_ids = [t["id"] async for t in db.trips.find({"user_id": user_id}, {"_id": 0, "id": 1})]
+    trips, itineraries, expenses = await asyncio.gather(
+        db.trips.find({"user_id": user_id, **changed}, {"_id": 0}).to_list(None),
+        db.itineraries.find({"trip_id": {"$in": trip_ids}, **changed}, {"_id": 0}).to_list(None),
+        db.expenses.find({"trip_id": {"$in": trip_ids}, **changed}, {"_id": 0}).to_list(None),
+    )
+    
+    deleted = {kind: [] for kind in SYNC_KINDS}
+    if since_at:
+        tombstones = db.tombstones.find(
+            {"user_id": user_id, "deleted_at": changed["updated_at"]}, {"_id": 0, "kind": 1, "id": 1}
+        )
+        async for tombstone in tombstones:
+            deleted[tombstone["kind"]].append(tombstone["id"])
+    
+    return {
+        "cursor": encode_sync_cursor(started),
+        "reset": since_at is None,
+        "trips": [TripResponse(**t) for t in trips],
+        "itineraries": [ItineraryResponse(**i) for i in itineraries],
+        "expenses": [ExpenseResponse(**e) for e in expenses],
+        "deleted": deleted,
+    }
+
 # ============ TRIP ROUTES ============
 
 @api_router.post("/trips", response_model=TripResponse)
@@ -269,23 +520,199 @@ async def create_trip(trip: TripCreate, current_user: dict = Depends(get_current
         "dasar_perjalanan": trip.dasar_perjalanan,
         "maksud_tujuan": trip.maksud_tujuan,
         "status": "draft",
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "expense_seq": 0,
+        "expense_total": 0.0,
+        "expense_count": 0,
+        "itinerary_count": 0,
+        "version": 0,
     }
+    trip_doc["created_at"] = trip_doc["updated_at"] = datetime.now(timezone.utc).isoformat()
     await db.trips.insert_one(trip_doc)
     return TripResponse(**trip_doc)
 
-@api_router.get("/trips", response_model=List[TripResponse])
-async def get_trips(current_user: dict = Depends(get_current_user)):
-    trips = await db.trips.find({"user_id": current_user["id"]}, {"_id": 0}).sort("created_at", -1).to_list(1000)
-    return [TripResponse(**t) for t in trips]
+TRIP_LIST_FIELDS = set(TripListItem.model_fields)
+
+def trip_filter_query(user_id: str, status: Optional[str] = None, tujuan: Optional[str] = None,
+                      dari_tanggal: Optional[str] = None, sampai_tanggal: Optional[str] = None) -> dict:
+    query = {"user_id": user_id}
+    if status:
+        query["status"] = status
+    if tujuan:
+        query["tujuan"] = {"$regex": re.escape(tujuan), "$options": "i"}
+    if dari_tanggal or sampai_tanggal:
+        query["tanggal_mulai"] = {}
+        if dari_tanggal:
+            query["tanggal_mulai"]["$gte"] = dari_tanggal
+        if sampai_tanggal:
+            query["tanggal_mulai"]["$lte"] = sampai_tanggal
+    return query
+
+def encode_trip_cursor(trip: dict) -> str:
+    raw = json.dumps([trip["created_at"], trip["id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_trip_cursor(cursor: str) -> dict:
+    # Keyset condition for "after this trip" in (created_at desc, id desc) order
+    try:
+        created_at, trip_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor tidak valid")
+    return {"$or": [
+        {"created_at": {"$lt": created_at}},
+        {"created_at": created_at, "id": {"$lt": trip_id}},
+    ]}
+
+@api_router.get("/trips", response_model=List[TripListItem], response_model_exclude_unset=True)
+async def get_trips(
+    response: Response,
+    limit: int = Query(1000, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    status_filter: Optional[str] = Query(None, alias="status"),
+    tujuan: Optional[str] = None,
+    dari_tanggal: Optional[str] = None,
+    sampai_tanggal: Optional[str] = None,
+    fields: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    query = trip_filter_query(current_user["id"], status_filter, tujuan, dari_tanggal, sampai_tanggal)
+    if cursor:
+        query = {"$and": [query, decode_trip_cursor(cursor)]}
+    
+    projection = {"_id": 0}
+    if fields:
+        requested = {f.strip() for f in fields.split(",") if f.strip()}
+        unknown = requested - TRIP_LIST_FIELDS
+        if unknown:
+            raise HTTPException(status_code=400, detail=f"Field tidak dikenal: {', '.join(sorted(unknown))}")
+        # id and created_at are always needed for the next cursor
+        projection.update({f: 1 for f in requested | {"id", "created_at"}})
+    
+    trips = await db.trips.find(query, projection).sort([("created_at", -1), ("id", -1)]).to_list(limit + 1)
+    if len(trips) > limit:
+        trips = trips[:limit]
+        response.headers["X-Next-Cursor"] = encode_trip_cursor(trips[-1])
+    return trips
+
+@api_router.get("/trips/stats")
+async def get_trip_stats(current_user: dict = Depends(get_current_user)):
+    # Per-status totals come from the trips' stored aggregates; trips that predate them are seeded first
+    legacy = await db.trips.find(
+        {"user_id": current_user["id"], **COUNTERS_MISSING}, {"_id": 0, "id": 1}
+    ).to_list(None)
+    if legacy:
+        await seed_trip_aggregates(db, [t["id"] for t in legacy])
+    
+    by_status_pipeline = [
+        {"$match": {"user_id": current_user["id"]}},
+        {"$group": {"_id": "$status", "count": {"$sum": 1}, "total_expense": {"$sum": "$expense_total"}}},
+    ]
+    # $lookup directly followed by $unwind is coalesced by the server, so the expenses of a
+    # trip are never gathered into one document (which could pass the 16 MB limit)
+    by_month_pipeline = [
+        {"$match": {"user_id": current_user["id"]}},
+        {"$project": {"_id": 0, "id": 1}},
+        {"$lookup": {"from": "expenses", "localField": "id", "foreignField": "trip_id", "as": "expenses"}},
+        {"$unwind": "$expenses"},
+        {"$group": {
+            "_id": {"$substrCP": ["$expenses.tanggal", 0, 7]},
+            "count": {"$sum": 1},
+            "total": {"$sum": "$expenses.jumlah"},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    by_status_rows, by_month_rows = await asyncio.gather(
+        db.trips.aggregate(by_status_pipeline).to_list(None),
+        db.trips.aggregate(by_month_pipeline).to_list(None),
+    )
+    
+    by_status = {g["_id"]: {"count": g["count"], "total_expense": g["total_expense"]} for g in by_status_rows}
+    return {
+        "total_trips": sum(g["count"] for g in by_status.values()),
+        "draft_count": by_status.get("draft", {}).get("count", 0),
+        "completed_count": by_status.get("completed", {}).get("count", 0),
+        "total_expense": sum(g["total_expense"] for g in by_status.values()),
+        "by_status": by_status,
+        "monthly_expenses": [
+            {"month": g["_id"], "count": g["count"], "total": g["total"]} for g in by_month_rows
+        ],
+    }
 
 @api_router.get("/trips/{trip_id}", response_model=TripResponse)
-async def get_trip(trip_id: str, current_user: dict = Depends(get_current_user)):
+async def get_trip(trip_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                   current_user: dict = Depends(get_current_user)):
     trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]}, {"_id": 0})
     if not trip:
         raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+    validators = trip_validators(trip, "trip")
+    if etag_matches(if_none_match, validators["ETag"]):
+        return not_modified(validators)
+    response.headers.update(validators)
     return TripResponse(**trip)
 
+BUNDLE_SECTIONS = {"trip", "itineraries", "expenses", "totals"}
+
+@api_router.get("/trips/{trip_id}/bundle")
+async def get_trip_bundle(trip_id: str, include: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    sections = BUNDLE_SECTIONS if not include else {s.strip() for s in include.split(",") if s.strip()}
+    unknown = sections - BUNDLE_SECTIONS
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Bagian tidak dikenal: {', '.join(sorted(unknown))}")
+    
+    trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]}, {"_id": 0})
+    if not trip:
+        raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+    
+    async def fetch_itineraries():
+        return await db.itineraries.find({"trip_id": trip_id}, {"_id": 0}).sort(
+            [("tanggal", 1), ("waktu", 1)]
+        ).to_list(1000)
+    
+    async def fetch_expenses():
+        return await db.expenses.find({"trip_id": trip_id}, {"_id": 0}).sort("nomor", 1).to_list(1000)
+    
+    async def fetch_expense_totals():
+        totals = await db.expenses.aggregate([
+            {"$match": {"trip_id": trip_id}},
+            {"$group": {"_id": None, "total": {"$sum": "$jumlah"}, "count": {"$sum": 1}}},
+        ]).to_list(1)
+        return totals[0] if totals else {"total": 0, "count": 0}
+    
+    # Totals come from the trip's stored aggregates; trips that predate them reuse the
+    # lists when those are requested anyway, otherwise they are counted server-side
+    totals = stored_totals(trip)
+    compute_totals = "totals" in sections and totals is None
+    fetchers = {}
+    if "itineraries" in sections:
+        fetchers["itineraries"] = fetch_itineraries()
+    if "expenses" in sections:
+        fetchers["expenses"] = fetch_expenses()
+    if compute_totals and "itineraries" not in sections:
+        fetchers["itinerary_count"] = db.itineraries.count_documents({"trip_id": trip_id})
+    if compute_totals and "expenses" not in sections:
+        fetchers["expense_totals"] = fetch_expense_totals()
+    results = dict(zip(fetchers, await asyncio.gather(*fetchers.values())))
+    
+    bundle = {}
+    if "trip" in sections:
+        bundle["trip"] = TripResponse(**trip)
+    if "itineraries" in sections:
+        bundle["itineraries"] = [ItineraryResponse(**i) for i in results["itineraries"]]
+    if "expenses" in sections:
+        bundle["expenses"] = [ExpenseResponse(**e) for e in results["expenses"]]
+    if "totals" in sections and totals is not None:
+        bundle["totals"] = totals
+    elif "totals" in sections:
+        if "expenses" in results:
+            expense_totals = {"total": sum(e["jumlah"] for e in results["expenses"]), "count": len(results["expenses"])}
+        else:
+            expense_totals = results["expense_totals"]
+        bundle["totals"] = {
+            "total_expense": expense_totals["total"],
+            "expense_count": expense_totals["count"],
+            "itinerary_count": len(results["itineraries"]) if "itineraries" in results else results["itinerary_count"],
+        }
+    return bundle
+
 @api_router.put("/trips/{trip_id}", response_model=TripResponse)
 async def update_trip(trip_id: str, trip: TripUpdate, current_user: dict = Depends(get_current_user)):
     existing = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]})
@@ -294,53 +721,149 @@ async def update_trip(trip_id: str, trip: TripUpdate, current_user: dict = Depen
     
     update_data = {k: v for k, v in trip.model_dump().items() if v is not None}
     if update_data:
-        await db.trips.update_one({"id": trip_id}, {"$set": update_data})
+        await touch_trip(trip_id, set_fields=update_data)
     
     updated = await db.trips.find_one({"id": trip_id}, {"_id": 0})
     return TripResponse(**updated)
 
+# Itineraries and expenses of deleted trips are purged in batches in the background
+trip_reaper = TripReaper(
+    db,
+    batch_size=int(os.environ.get('TRIP_REAPER_BATCH_SIZE', '1000')),
+    interval=float(os.environ.get('TRIP_REAPER_INTERVAL_SECONDS', '60')),
+)
+
 @api_router.delete("/trips/{trip_id}")
 async def delete_trip(trip_id: str, current_user: dict = Depends(get_current_user)):
-    result = await db.trips.delete_one({"id": trip_id, "user_id": current_user["id"]})
-    if result.deleted_count == 0:
+    # Trip, purge marker and tombstone commit together; the children are unreachable once
+    # the trip is gone (every child route checks it) and the reaper deletes them later.
+    # The marker is written first so a standalone server never loses it on a crash.
+    async def remove(session):
+        await db.trip_purges.insert_one(
+            {"trip_id": trip_id, "created_at": datetime.now(timezone.utc).isoformat()}, session=session
+        )
+        result = await db.trips.delete_one({"id": trip_id, "user_id": current_user["id"]}, session=session)
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+        # Synced clients drop the trip's itineraries and expenses with it
+        await record_tombstones("trips", trip_id, current_user["id"], [trip_id], session)
+    
+    if not await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]}, {"_id": 1}):
         raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
-    
-    # Delete related itineraries and expenses
-    await db.itineraries.delete_many({"trip_id": trip_id})
-    await db.expenses.delete_many({"trip_id": trip_id})
+    await run_in_transaction(client, remove)
+    trip_reaper.wake()
     
     return {"message": "Perjalanan berhasil dihapus"}
 
-# ============ ITINERARY ROUTES ============
+# ============ WRITE HELPERS ============
 
-@api_router.post("/trips/{trip_id}/itineraries", response_model=ItineraryResponse)
-async def create_itinerary(trip_id: str, itinerary: ItineraryCreate, current_user: dict = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]})
-    if not trip:
-        raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
-    
-    itinerary_id = str(uuid.uuid4())
-    itinerary_doc = {
-        "id": itinerary_id,
+def new_itinerary_doc(trip_id: str, itinerary: ItineraryCreate) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
         "trip_id": trip_id,
         "tanggal": itinerary.tanggal,
         "waktu": itinerary.waktu,
         "kegiatan": itinerary.kegiatan,
         "lokasi": itinerary.lokasi,
-        "catatan": itinerary.catatan or ""
+        "catatan": itinerary.catatan or "",
+        "updated_at": datetime.now(timezone.utc).isoformat()
     }
-    await db.itineraries.insert_one(itinerary_doc)
-    return ItineraryResponse(**itinerary_doc)
 
-@api_router.get("/trips/{trip_id}/itineraries", response_model=List[ItineraryResponse])
-async def get_itineraries(trip_id: str, current_user: dict = Depends(get_current_user)):
+def new_expense_doc(trip_id: str, nomor: int, expense: ExpenseCreate) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "trip_id": trip_id,
+        "nomor": nomor,
+        "tanggal": expense.tanggal,
+        "uraian": expense.uraian,
+        "jumlah": expense.jumlah,
+        "catatan": expense.catatan or "",
+        "updated_at": datetime.now(timezone.utc).isoformat()
+    }
+
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '500'))
+
+def check_batch_size(batch: BatchRequest):
+    if len(batch.create) + len(batch.update) + len(batch.delete) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Maksimal {BATCH_MAX_ITEMS} item per batch")
+
+def validation_message(error: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(p) for p in e['loc'])}: {e['msg']}" for e in error.errors())
+
+def validate_batch_items(items: List[dict], model, with_id: bool = False):
+    # Returns ([(index, id, model instance)], [error result])
+    valid, errors = [], []
+    for index, raw in enumerate(items):
+        data = dict(raw)
+        item_id = data.pop("id", None) if with_id else None
+        if with_id and not isinstance(item_id, str):
+            errors.append({"index": index, "id": item_id, "status": "error", "error": "id: Field required"})
+            continue
+        try:
+            valid.append((index, item_id, model.model_validate(data)))
+        except ValidationError as e:
+            errors.append({"index": index, "id": item_id, "status": "error", "error": validation_message(e)})
+    return valid, errors
+
+def batch_delete_results(ids: List[str], found: dict, not_found_detail: str) -> list:
+    return [
+        {"index": i, "id": item_id, "status": "deleted"} if item_id in found
+        else {"index": i, "id": item_id, "status": "error", "error": not_found_detail}
+        for i, item_id in enumerate(ids)
+    ]
+
+async def apply_batch_updates(collection, trip_id: str, updates: list, response_model, not_found_detail: str,
+                              session=None):
+    # Applies the updates with one bulk_write; returns (results, {id: (doc before, doc after)})
+    ids = [item_id for _, item_id, _ in updates]
+    existing = {
+        doc["id"]: doc
+        for doc in await collection.find({"trip_id": trip_id, "id": {"$in": ids}}, {"_id": 0}, session=session).to_list(None)
+    }
+    results, current, requests = [], {}, []
+    for index, item_id, model in updates:
+        if item_id not in existing:
+            results.append({"index": index, "id": item_id, "status": "error", "error": not_found_detail})
+            continue
+        update_data = {k: v for k, v in model.model_dump().items() if v is not None}
+        if update_data:
+            update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+            requests.append(UpdateOne({"id": item_id, "trip_id": trip_id}, {"$set": update_data}))
+        current[item_id] = {**current.get(item_id, existing[item_id]), **update_data}
+        results.append({"index": index, "id": item_id, "status": "updated", "item": response_model(**current[item_id])})
+    if requests:
+        await collection.bulk_write(requests, session=session)
+    return results, {item_id: (existing[item_id], doc) for item_id, doc in current.items()}
+
+# ============ ITINERARY ROUTES ============
+
+@api_router.post("/trips/{trip_id}/itineraries", response_model=ItineraryResponse)
+async def create_itinerary(trip_id: str, itinerary: ItineraryCreate, current_user: dict = Depends(get_current_user)):
     trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]})
     if not trip:
         raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
     
-    itineraries = await db.itineraries.find({"trip_id": trip_id}, {"_id": 0}).to_list(1000)
-    # Sort by date and time
-    itineraries.sort(key=lambda x: (x["tanggal"], x["waktu"]))
+    itinerary_doc = new_itinerary_doc(trip_id, itinerary)
+    
+    async def insert(session):
+        await db.itineraries.insert_one(itinerary_doc, session=session)
+        await touch_trip(trip_id, {"itinerary_count": 1}, session=session)
+    
+    await run_in_transaction(client, insert)
+    itinerary_doc.pop("_id", None)
+    return ItineraryResponse(**itinerary_doc)
+
+@api_router.get("/trips/{trip_id}/itineraries", response_model=List[ItineraryResponse])
+async def get_itineraries(trip_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                          current_user: dict = Depends(get_current_user)):
+    validators = trip_validators(await trip_version(trip_id, current_user["id"]), "itineraries")
+    if etag_matches(if_none_match, validators["ETag"]):
+        return not_modified(validators)
+    response.headers.update(validators)
+    
+    itineraries = await db.itineraries.find({"trip_id": trip_id}, {"_id": 0}).sort(
+        [("tanggal", 1), ("waktu", 1)]
+    ).to_list(1000)
     return [ItineraryResponse(**i) for i in itineraries]
 
 @api_router.put("/trips/{trip_id}/itineraries/{itinerary_id}", response_model=ItineraryResponse)
@@ -355,7 +878,13 @@ async def update_itinerary(trip_id: str, itinerary_id: str, itinerary: Itinerary
     
     update_data = {k: v for k, v in itinerary.model_dump().items() if v is not None}
     if update_data:
-        await db.itineraries.update_one({"id": itinerary_id}, {"$set": update_data})
+        update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+        
+        async def update(session):
+            await db.itineraries.update_one({"id": itinerary_id}, {"$set": update_data}, session=session)
+            await touch_trip(trip_id, session=session)
+        
+        await run_in_transaction(client, update)
     
     updated = await db.itineraries.find_one({"id": itinerary_id}, {"_id": 0})
     return ItineraryResponse(**updated)
@@ -366,41 +895,120 @@ async def delete_itinerary(trip_id: str, itinerary_id: str, current_user: dict =
     if not trip:
         raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
     
-    result = await db.itineraries.delete_one({"id": itinerary_id, "trip_id": trip_id})
-    if result.deleted_count == 0:
-        raise HTTPException(status_code=404, detail="Itinerary tidak ditemukan")
+    async def remove(session):
+        result = await db.itineraries.delete_one({"id": itinerary_id, "trip_id": trip_id}, session=session)
+        if result.deleted_count == 0:
+            raise HTTPException(status_code=404, detail="Itinerary tidak ditemukan")
+        await touch_trip(trip_id, {"itinerary_count": -1}, session=session)
+        await record_tombstones("itineraries", trip_id, current_user["id"], [itinerary_id], session)
+    
+    await run_in_transaction(client, remove)
     
     return {"message": "Itinerary berhasil dihapus"}
 
+@api_router.post("/trips/{trip_id}/itineraries:batch")
+async def batch_itineraries(trip_id: str, batch: BatchRequest, current_user: dict = Depends(get_current_user)):
+    check_batch_size(batch)
+    creates, create_errors = validate_batch_items(batch.create, ItineraryCreate)
+    updates, update_errors = validate_batch_items(batch.update, ItineraryUpdate, with_id=True)
+    
+    # Deletes, then updates, then inserts, all in one transaction
+    async def apply(session):
+        trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]}, {"_id": 1}, session=session)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+        
+        found = {}
+        if batch.delete:
+            found = {
+                doc["id"]: doc for doc in await db.itineraries.find(
+                    {"trip_id": trip_id, "id": {"$in": batch.delete}}, {"_id": 0, "id": 1}, session=session
+                ).to_list(None)
+            }
+            if found:
+                await db.itineraries.delete_many({"trip_id": trip_id, "id": {"$in": list(found)}}, session=session)
+                await record_tombstones("itineraries", trip_id, current_user["id"], list(found), session)
+        delete_results = batch_delete_results(batch.delete, found, "Itinerary tidak ditemukan")
+        
+        update_results, changes = await apply_batch_updates(
+            db.itineraries, trip_id, updates, ItineraryResponse, "Itinerary tidak ditemukan", session
+        )
+        
+        docs = [new_itinerary_doc(trip_id, item) for _, _, item in creates]
+        if docs:
+            await db.itineraries.insert_many(docs, session=session)
+        create_results = [
+            {"index": index, "id": doc["id"], "status": "created", "item": ItineraryResponse(**doc)}
+            for (index, _, _), doc in zip(creates, docs)
+        ]
+        
+        if docs or found or changes:
+            await touch_trip(trip_id, {"itinerary_count": len(docs) - len(found)}, session=session)
+        return create_results, update_results, delete_results
+    
+    create_results, update_results, delete_results = await run_in_transaction(client, apply)
+    return {
+        "create": sorted(create_results + create_errors, key=lambda r: r["index"]),
+        "update": sorted(update_results + update_errors, key=lambda r: r["index"]),
+        "delete": delete_results,
+    }
+
 # ============ EXPENSE ROUTES ============
 
+async def reserve_expense_numbers(trip_id: str, user_id: str, count: int = 1, total: float = 0,
+                                  session=None) -> Optional[int]:
+    # Atomically bump the trip's expense counter and aggregates (also checks ownership);
+    # returns the first reserved nomor, or None if the trip is not the user's
+    ownership = {"id": trip_id, "user_id": user_id}
+    trip = await db.trips.find_one_and_update(
+        {**ownership, **COUNTERS_PRESENT},
+        {
+            "$inc": {"expense_seq": count, "expense_count": count, "expense_total": total, "version": 1},
+            "$set": {"updated_at": datetime.now(timezone.utc).isoformat()},
+        },
+        projection={"_id": 0, "expense_seq": 1},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+    if trip is None:
+        if not await db.trips.find_one(ownership, {"_id": 1}, session=session):
+            return None
+        # Trip predates the counters: seed them from the existing rows once
+        await seed_trip_aggregates(db, [trip_id], session)
+        return await reserve_expense_numbers(trip_id, user_id, count, total, session)
+    return trip["expense_seq"] - count + 1
+
+async def run_expense_numbering(trip_ids: List[str], callback):
+    # Writes that hand out or shift expense numbers. Without transactions a delete's renumbering could
+    # land between another request's reservation and its insert, so they take turns per trip instead.
+    try:
+        return await run_serialized(client, db.trips, trip_ids, callback)
+    except LeaseTimeoutError:
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+
 @api_router.post("/trips/{trip_id}/expenses", response_model=ExpenseResponse)
 async def create_expense(trip_id: str, expense: ExpenseCreate, current_user: dict = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]})
-    if not trip:
-        raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
-    
-    # Get next number
-    count = await db.expenses.count_documents({"trip_id": trip_id})
-    
-    expense_id = str(uuid.uuid4())
-    expense_doc = {
-        "id": expense_id,
-        "trip_id": trip_id,
-        "nomor": count + 1,
-        "tanggal": expense.tanggal,
-        "uraian": expense.uraian,
-        "jumlah": expense.jumlah,
-        "catatan": expense.catatan or ""
-    }
-    await db.expenses.insert_one(expense_doc)
+    # Counter bump and insert share a transaction (or trip lease), so a delete's renumbering can't interleave
+    async def insert(session):
+        nomor = await reserve_expense_numbers(trip_id, current_user["id"], total=expense.jumlah, session=session)
+        if nomor is None:
+            raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+        
+        expense_doc = new_expense_doc(trip_id, nomor, expense)
+        await db.expenses.insert_one(expense_doc, session=session)
+        expense_doc.pop("_id", None)
+        return expense_doc
+    
+    expense_doc = await run_expense_numbering([trip_id], insert)
     return ExpenseResponse(**expense_doc)
 
 @api_router.get("/trips/{trip_id}/expenses", response_model=List[ExpenseResponse])
-async def get_expenses(trip_id: str, current_user: dict = Depends(get_current_user)):
-    trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]})
-    if not trip:
-        raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+async def get_expenses(trip_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                       current_user: dict = Depends(get_current_user)):
+    validators = trip_validators(await trip_version(trip_id, current_user["id"]), "expenses")
+    if etag_matches(if_none_match, validators["ETag"]):
+        return not_modified(validators)
+    response.headers.update(validators)
     
     expenses = await db.expenses.find({"trip_id": trip_id}, {"_id": 0}).sort("nomor", 1).to_list(1000)
     return [ExpenseResponse(**e) for e in expenses]
@@ -417,7 +1025,19 @@ async def update_expense(trip_id: str, expense_id: str, expense: ExpenseUpdate,
     
     update_data = {k: v for k, v in expense.model_dump().items() if v is not None}
     if update_data:
-        await db.expenses.update_one({"id": expense_id}, {"$set": update_data})
+        update_data["updated_at"] = datetime.now(timezone.utc).isoformat()
+        
+        async def update(session):
+            previous = await db.expenses.find_one_and_update(
+                {"id": expense_id, "trip_id": trip_id}, {"$set": update_data},
+                projection={"_id": 0, "jumlah": 1}, session=session
+            )
+            if not previous:
+                raise HTTPException(status_code=404, detail="Biaya tidak ditemukan")
+            delta = update_data.get("jumlah", previous["jumlah"]) - previous["jumlah"]
+            await touch_trip(trip_id, {"expense_total": delta}, session=session)
+        
+        await run_in_transaction(client, update)
     
     updated = await db.expenses.find_one({"id": expense_id}, {"_id": 0})
     return ExpenseResponse(**updated)
@@ -428,35 +1048,223 @@ async def delete_expense(trip_id: str, expense_id: str, current_user: dict = Dep
     if not trip:
         raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
     
-    deleted = await db.expenses.find_one({"id": expense_id, "trip_id": trip_id})
-    if not deleted:
-        raise HTTPException(status_code=404, detail="Biaya tidak ditemukan")
-    
-    await db.expenses.delete_one({"id": expense_id})
+    # Delete, shift later numbers down by one and decrement the counters as one unit
+    async def remove(session):
+        deleted = await db.expenses.find_one_and_delete(
+            {"id": expense_id, "trip_id": trip_id}, projection={"_id": 0, "nomor": 1, "jumlah": 1}, session=session
+        )
+        if not deleted:
+            raise HTTPException(status_code=404, detail="Biaya tidak ditemukan")
+        await close_expense_number_gaps(trip_id, [deleted], session)
+        await record_tombstones("expenses", trip_id, current_user["id"], [expense_id], session)
     
-    # Renumber remaining expenses
-    remaining = await db.expenses.find({"trip_id": trip_id}, {"_id": 0}).sort("nomor", 1).to_list(1000)
-    for i, exp in enumerate(remaining):
-        await db.expenses.update_one({"id": exp["id"]}, {"$set": {"nomor": i + 1}})
+    await run_expense_numbering([trip_id], remove)
     
     return {"message": "Biaya berhasil dihapus"}
 
+async def close_expense_number_gaps(trip_id: str, deleted: List[dict], session=None):
+    # After deleting expenses, shift each later row down by the number of deleted rows before
+    # it (one UpdateMany per gap) and take them off the trip's counters
+    nomors = sorted(d["nomor"] for d in deleted)
+    requests = []
+    for shift, nomor in enumerate(nomors, 1):
+        bounds = {"$gt": nomor}
+        if shift < len(nomors):
+            bounds["$lt"] = nomors[shift]
+        requests.append(UpdateMany(
+            {"trip_id": trip_id, "nomor": bounds},
+            {"$inc": {"nomor": -shift}, "$set": {"updated_at": datetime.now(timezone.utc).isoformat()}}
+        ))
+    await db.expenses.bulk_write(requests, session=session)
+    await touch_trip(trip_id, {
+        "expense_count": -len(deleted),
+        "expense_total": -sum(d["jumlah"] for d in deleted),
+        "expense_seq": -len(deleted),
+    }, session=session)
+
+@api_router.post("/trips/{trip_id}/expenses:batch")
+async def batch_expenses(trip_id: str, batch: BatchRequest, current_user: dict = Depends(get_current_user)):
+    check_batch_size(batch)
+    creates, create_errors = validate_batch_items(batch.create, ExpenseCreate)
+    updates, update_errors = validate_batch_items(batch.update, ExpenseUpdate, with_id=True)
+    
+    # Deletes (with renumbering), then updates, then inserts numbered in one counter bump
+    async def apply(session):
+        trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]}, {"_id": 1}, session=session)
+        if not trip:
+            raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+        
+        found = {}
+        if batch.delete:
+            found = {
+                doc["id"]: doc for doc in await db.expenses.find(
+                    {"trip_id": trip_id, "id": {"$in": batch.delete}}, {"_id": 0, "id": 1, "nomor": 1, "jumlah": 1},
+                    session=session
+                ).to_list(None)
+            }
+            if found:
+                await db.expenses.delete_many({"trip_id": trip_id, "id": {"$in": list(found)}}, session=session)
+                await close_expense_number_gaps(trip_id, list(found.values()), session)
+                await record_tombstones("expenses", trip_id, current_user["id"], list(found), session)
+        delete_results = batch_delete_results(batch.delete, found, "Biaya tidak ditemukan")
+        
+        update_results, changes = await apply_batch_updates(
+            db.expenses, trip_id, updates, ExpenseResponse, "Biaya tidak ditemukan", session
+        )
+        if changes:
+            delta = sum(new["jumlah"] - old["jumlah"] for old, new in changes.values())
+            await touch_trip(trip_id, {"expense_total": delta}, session=session)
+        
+        create_results = []
+        if creates:
+            first = await reserve_expense_numbers(
+                trip_id, current_user["id"], count=len(creates), total=sum(item.jumlah for _, _, item in creates),
+                session=session
+            )
+            docs = [new_expense_doc(trip_id, first + offset, item) for offset, (_, _, item) in enumerate(creates)]
+            await db.expenses.insert_many(docs, session=session)
+            create_results = [
+                {"index": index, "id": doc["id"], "status": "created", "item": ExpenseResponse(**doc)}
+                for (index, _, _), doc in zip(creates, docs)
+            ]
+        return create_results, update_results, delete_results
+    
+    create_results, update_results, delete_results = await run_expense_numbering([trip_id], apply)
+    return {
+        "create": sorted(create_results + create_errors, key=lambda r: r["index"]),
+        "update": sorted(update_results + update_errors, key=lambda r: r["index"]),
+        "delete": delete_results,
+    }
+
+# ============ IMPORT ============
+
+IMPORT_CHUNK_ROWS = int(os.environ.get('IMPORT_CHUNK_ROWS', '1000'))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', '1000'))
+IMPORT_MODELS = {"expenses": ExpenseCreate, "itineraries": ItineraryCreate}
+
+async def write_import_chunk(kind: str, by_trip: dict, user_id: str, session=None):
+    # by_trip: {trip_id: [(row number, validated item)]}, all trips already known to be the user's
+    docs = []
+    if kind == "expenses":
+        for trip_id, rows in by_trip.items():
+            first = await reserve_expense_numbers(
+                trip_id, user_id, count=len(rows), total=sum(item.jumlah for _, item in rows), session=session
+            )
+            docs.extend(new_expense_doc(trip_id, first + offset, item) for offset, (_, item) in enumerate(rows))
+        await db.expenses.insert_many(docs, session=session)
+    else:
+        # Seed legacy trips before the rows go in, so the $inc below adds to the real count
+        await seed_trip_aggregates(db, list(by_trip), session)
+        for trip_id, rows in by_trip.items():
+            docs.extend(new_itinerary_doc(trip_id, item) for _, item in rows)
+        await db.itineraries.insert_many(docs, session=session)
+        await db.trips.bulk_write([
+            UpdateOne({"id": trip_id}, trip_touch({"itinerary_count": len(rows)})) for trip_id, rows in by_trip.items()
+        ], session=session)
+
+@api_router.post("/import/{kind}")
+async def import_rows(kind: str, file: UploadFile = File(...), trip_id: Optional[str] = None,
+                      current_user: dict = Depends(get_current_user)):
+    # Rows go to ?trip_id= when given, otherwise to each row's own trip_id column
+    model = IMPORT_MODELS.get(kind)
+    if model is None:
+        raise HTTPException(status_code=404, detail="Jenis impor tidak dikenal")
+    try:
+        file_format = detect_format(file.filename, file.content_type)
+    except ImportFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    rows = iter_csv_rows(file.file) if file_format == "csv" else iter_xlsx_rows(file.file)
+    summary = {"rows": 0, "imported": 0, "failed": 0, "errors": [], "aborted": None}
+    owned = {}
+    
+    def fail(row_number: int, error: str):
+        summary["failed"] += 1
+        if len(summary["errors"]) < IMPORT_MAX_ERRORS:
+            summary["errors"].append({"row": row_number, "error": error})
+    
+    try:
+        async for chunk in iter_chunks(rows, IMPORT_CHUNK_ROWS):
+            summary["rows"] += len(chunk)
+            by_trip = {}
+            for row_number, values in chunk:
+                row_trip = values.pop("trip_id", None)
+                row_trip = trip_id or row_trip
+                if not row_trip:
+                    fail(row_number, "trip_id: Field required")
+                    continue
+                try:
+                    by_trip.setdefault(row_trip, []).append((row_number, model.model_validate(values)))
+                except ValidationError as e:
+                    fail(row_number, validation_message(e))
+            
+            unknown = [t for t in by_trip if t not in owned]
+            if unknown:
+                found = await db.trips.find(
+                    {"id": {"$in": unknown}, "user_id": current_user["id"]}, {"_id": 0, "id": 1}
+                ).to_list(None)
+                found_ids = {t["id"] for t in found}
+                owned.update({t: t in found_ids for t in unknown})
+            for t in [t for t in by_trip if not owned[t]]:
+                for row_number, _ in by_trip.pop(t):
+                    fail(row_number, "Perjalanan tidak ditemukan")
+            
+            if by_trip:
+                await run_expense_numbering(
+                    list(by_trip) if kind == "expenses" else [],
+                    lambda session: write_import_chunk(kind, by_trip, current_user["id"], session)
+                )
+                summary["imported"] += sum(len(r) for r in by_trip.values())
+    except (ImportFormatError, UnicodeDecodeError, csv.Error) as e:
+        if summary["rows"] == 0:
+            raise HTTPException(status_code=400, detail=str(e))
+        # Chunks before the unreadable part are already stored
+        summary["aborted"] = str(e)
+    finally:
+        await file.close()
+    
+    summary["errors"].sort(key=lambda e: e["row"])
+    summary["errors_truncated"] = summary["failed"] > len(summary["errors"])
+    return summary
+
 # ============ REPORT ROUTES ============
 
+# Rows loaded per list for a report; the PDF builder renders long lists page by page
+REPORT_MAX_ROWS = int(os.environ.get('REPORT_MAX_ROWS', '10000'))
+
+def report_validators(version: dict, current_user: dict, *parts) -> dict:
+    # Reports also depend on the profile printed in them and the template picked for its unit
+    unit = current_user.get("unit", "")
+    profile = [current_user.get(f, "") for f in ("full_name", "nip", "jabatan")]
+    template = layout_key({"template": template_for_unit(unit)})
+    return trip_validators(version, "report", *profile, unit, template, *parts)
+
 @api_router.get("/trips/{trip_id}/report/validate")
-async def validate_report(trip_id: str, current_user: dict = Depends(get_current_user)):
+async def validate_report(trip_id: str, response: Response, if_none_match: Optional[str] = Header(None),
+                          current_user: dict = Depends(get_current_user)):
+    validators = report_validators(await trip_version(trip_id, current_user["id"]), current_user, "validate")
+    if etag_matches(if_none_match, validators["ETag"]):
+        return not_modified(validators)
+    response.headers.update(validators)
+    return await load_report_data(trip_id, current_user)
+
+async def load_report_data(trip_id: str, current_user: dict) -> dict:
     trip = await db.trips.find_one({"id": trip_id, "user_id": current_user["id"]}, {"_id": 0})
     if not trip:
         raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
     
-    itineraries = await db.itineraries.find({"trip_id": trip_id}, {"_id": 0}).to_list(1000)
-    expenses = await db.expenses.find({"trip_id": trip_id}, {"_id": 0}).to_list(1000)
+    itineraries = await db.itineraries.find({"trip_id": trip_id}, {"_id": 0}).sort(
+        [("tanggal", 1), ("waktu", 1)]
+    ).to_list(REPORT_MAX_ROWS)
+    expenses = await db.expenses.find({"trip_id": trip_id}, {"_id": 0}).sort("nomor", 1).to_list(REPORT_MAX_ROWS)
     
     profile_completed = bool(current_user.get("nip") and current_user.get("jabatan") and current_user.get("unit"))
     trip_completed = bool(trip.get("judul") and trip.get("tujuan") and trip.get("tanggal_mulai") and 
                          trip.get("tanggal_selesai") and trip.get("dasar_perjalanan") and trip.get("maksud_tujuan"))
     has_itinerary = len(itineraries) > 0
     has_expense = len(expenses) > 0
+    # Stored aggregates cover every expense, not just the first REPORT_MAX_ROWS
+    totals = stored_totals(trip)
     
     return {
         "profile_completed": profile_completed,
@@ -470,271 +1278,353 @@ async def validate_report(trip_id: str, current_user: dict = Depends(get_current
             "jabatan": current_user.get("jabatan", ""),
             "unit": current_user.get("unit", "")
         },
+        "template": template_for_unit(current_user.get("unit", "")),
         "trip": trip,
-        "itineraries": sorted(itineraries, key=lambda x: (x["tanggal"], x["waktu"])),
-        "expenses": sorted(expenses, key=lambda x: x["nomor"]),
-        "total_expense": sum(e["jumlah"] for e in expenses)
+        "itineraries": itineraries,
+        "expenses": expenses,
+        "total_expense": totals["total_expense"] if totals else sum(e["jumlah"] for e in expenses)
     }
 
+# Flags in load_report_data's result that only gate rendering
+REPORT_READINESS_FLAGS = ("profile_completed", "trip_completed", "has_itinerary", "has_expense", "can_generate")
+
 @api_router.get("/trips/{trip_id}/report")
-async def generate_report(trip_id: str, format: str = "pdf", current_user: dict = Depends(get_current_user)):
-    validation = await validate_report(trip_id, current_user)
+async def generate_report(trip_id: str, format: str = "pdf", range_header: Optional[str] = Header(None, alias="Range"),
+                          if_none_match: Optional[str] = Header(None), current_user: dict = Depends(get_current_user)):
+    format = "xlsx" if format == "xlsx" else "pdf"
+    # The signature block prints today's date, so the tag changes daily as well
+    validators = report_validators(
+        await trip_version(trip_id, current_user["id"]), current_user, format, datetime.now().strftime("%Y-%m-%d")
+    )
+    if etag_matches(if_none_match, validators["ETag"]):
+        return not_modified(validators)
+    
+    validation = await load_report_data(trip_id, current_user)
     if not validation["can_generate"]:
         raise HTTPException(status_code=400, detail="Data belum lengkap untuk generate laporan")
     
-    if format == "xlsx":
-        return await generate_excel_report(validation)
+    if validation["trip"].get("status") == "completed":
+        artifact = await archived_report(format, validation, current_user)
+        result = artifact_response(artifact, range_header)
+    elif format == "xlsx":
+        result = await generate_excel_report(validation)
     else:
-        return await generate_pdf_report(validation)
+        result = await generate_pdf_report(validation)
+    result.headers.update(validators)
+    return result
 
-async def generate_pdf_report(data: dict):
-    from reportlab.lib import colors
-    from reportlab.lib.pagesizes import A4
-    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-    from reportlab.lib.units import cm
-    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
-    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-    
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, topMargin=2*cm, bottomMargin=2*cm, leftMargin=2*cm, rightMargin=2*cm)
-    
-    styles = getSampleStyleSheet()
-    title_style = ParagraphStyle('Title', parent=styles['Heading1'], fontSize=14, alignment=TA_CENTER, spaceAfter=12)
-    subtitle_style = ParagraphStyle('Subtitle', parent=styles['Normal'], fontSize=11, alignment=TA_CENTER, spaceAfter=24)
-    heading_style = ParagraphStyle('Heading', parent=styles['Heading2'], fontSize=11, spaceAfter=8, spaceBefore=16)
-    normal_style = ParagraphStyle('Normal', parent=styles['Normal'], fontSize=10)
-    
-    elements = []
-    
-    # Header
-    elements.append(Paragraph("LAPORAN PERJALANAN DINAS", title_style))
-    elements.append(Paragraph(f"Nomor: -", subtitle_style))
-    
-    # Trip Info
-    trip = data["trip"]
-    user = data["user"]
-    
-    info_data = [
-        ["Nama", ":", user["full_name"]],
-        ["NIP", ":", user["nip"]],
-        ["Jabatan", ":", user["jabatan"]],
-        ["Unit/Bagian", ":", user["unit"]],
-        ["", "", ""],
-        ["Judul Perjalanan", ":", trip["judul"]],
-        ["Tujuan", ":", trip["tujuan"]],
-        ["Tanggal", ":", f"{trip['tanggal_mulai']} s.d. {trip['tanggal_selesai']}"],
-        ["Dasar Perjalanan", ":", trip["dasar_perjalanan"]],
-        ["Maksud dan Tujuan", ":", trip["maksud_tujuan"]],
-    ]
-    
-    info_table = Table(info_data, colWidths=[4*cm, 0.5*cm, 10*cm])
-    info_table.setStyle(TableStyle([
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    elements.append(info_table)
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Itinerary Section
-    elements.append(Paragraph("I. URAIAN KEGIATAN", heading_style))
-    
-    itinerary_header = [["No", "Tanggal", "Waktu", "Kegiatan", "Lokasi"]]
-    itinerary_data = itinerary_header + [
-        [str(i+1), it["tanggal"], it["waktu"], it["kegiatan"], it["lokasi"]]
-        for i, it in enumerate(data["itineraries"])
-    ]
-    
-    itinerary_table = Table(itinerary_data, colWidths=[1*cm, 2.5*cm, 1.5*cm, 7*cm, 3*cm])
-    itinerary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.9, 0.9, 0.9)),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-    ]))
-    elements.append(itinerary_table)
-    elements.append(Spacer(1, 0.5*cm))
-    
-    # Expense Section
-    elements.append(Paragraph("II. RINCIAN BIAYA", heading_style))
-    
-    def format_rupiah(amount):
-        return f"Rp {amount:,.0f}".replace(",", ".")
-    
-    expense_header = [["No", "Tanggal", "Uraian", "Jumlah (Rp)"]]
-    expense_data = expense_header + [
-        [str(exp["nomor"]), exp["tanggal"], exp["uraian"], format_rupiah(exp["jumlah"])]
-        for exp in data["expenses"]
-    ]
-    expense_data.append(["", "", "TOTAL", format_rupiah(data["total_expense"])])
-    
-    expense_table = Table(expense_data, colWidths=[1*cm, 2.5*cm, 8*cm, 3.5*cm])
-    expense_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.Color(0.9, 0.9, 0.9)),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (-1, 1), (-1, -1), 'RIGHT'),
-        ('FONTNAME', (2, -1), (-1, -1), 'Helvetica-Bold'),
-        ('BACKGROUND', (0, -1), (-1, -1), colors.Color(0.95, 0.95, 0.95)),
-    ]))
-    elements.append(expense_table)
-    elements.append(Spacer(1, 1.5*cm))
-    
-    # Signature Section
-    from datetime import datetime
-    today = datetime.now().strftime("%d-%m-%Y")
-    
-    signature_data = [
-        ["", f"__________, {today}"],
-        ["Mengetahui,", "Yang Membuat Laporan,"],
-        ["Atasan Langsung", ""],
-        ["", ""],
-        ["", ""],
-        ["", ""],
-        ["(_________________)", f"({user['full_name']})"],
-        ["NIP.", f"NIP. {user['nip']}"],
-    ]
-    
-    sig_table = Table(signature_data, colWidths=[7.5*cm, 7.5*cm])
-    sig_table.setStyle(TableStyle([
-        ('FONTSIZE', (0, 0), (-1, -1), 10),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-    ]))
-    elements.append(sig_table)
-    
-    doc.build(elements)
-    buffer.seek(0)
+@api_router.post("/trips/{trip_id}/report/jobs", response_model=ReportJobResponse, status_code=202)
+async def create_report_job(trip_id: str, format: str = "pdf", current_user: dict = Depends(get_current_user)):
+    validation = await load_report_data(trip_id, current_user)
+    if not validation["can_generate"]:
+        raise HTTPException(status_code=400, detail="Data belum lengkap untuk generate laporan")
     
-    filename = f"laporan_perjalanan_{trip['judul'].replace(' ', '_')}.pdf"
-    return StreamingResponse(
-        buffer,
-        media_type="application/pdf",
+    format = "xlsx" if format == "xlsx" else "pdf"
+    # Everything the builders read (template included), minus the readiness flags
+    payload = {k: v for k, v in validation.items() if k not in REPORT_READINESS_FLAGS}
+    try:
+        job = await report_jobs.submit(
+            trip_id, current_user["id"], format, payload, filename=report_filename(validation["trip"], format)
+        )
+    except JobQueueFullError:
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+    return ReportJobResponse(**job)
+
+@api_router.get("/trips/{trip_id}/report/jobs/{job_id}", response_model=ReportJobResponse)
+async def get_report_job(trip_id: str, job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.report_jobs.find_one(
+        {"id": job_id, "trip_id": trip_id, "user_id": current_user["id"]}, JOB_STATUS_PROJECTION
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job laporan tidak ditemukan")
+    return ReportJobResponse(**job)
+
+@api_router.get("/trips/{trip_id}/report/jobs/{job_id}/file")
+async def download_report_job(trip_id: str, job_id: str, current_user: dict = Depends(get_current_user)):
+    job = await db.report_jobs.find_one(
+        {"id": job_id, "trip_id": trip_id, "user_id": current_user["id"]},
+        {"_id": 0, "status": 1, "format": 1, "filename": 1, "content": 1}
+    )
+    if not job:
+        raise HTTPException(status_code=404, detail="Job laporan tidak ditemukan")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail="Laporan belum selesai dibuat")
+    
+    # Jobs outlive their trip, so the name is kept on the job itself
+    filename = job.get("filename")
+    if filename is None:
+        trip = await db.trips.find_one({"id": trip_id}, {"_id": 0, "judul": 1})
+        if not trip:
+            raise HTTPException(status_code=404, detail="Perjalanan tidak ditemukan")
+        filename = report_filename(trip, job["format"])
+    return attachment_response(job["format"], filename, job["content"])
+
+async def render_report_bytes(format: str, data: dict) -> bytes:
+    # The cache key hashes the trip's data, so it doubles as (trip, format, data version)
+    cache_key = report_cache_key(format, data, layout_key(data))
+    cached = await report_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    return await report_flights.run(cache_key, render_and_cache_report, format, data, cache_key)
+
+# Background report jobs for large trips; the GET route stays as the fast path
+report_jobs = ReportJobQueue(
+    db.report_jobs,
+    render_report_bytes,
+    workers=int(os.environ.get('REPORT_JOB_WORKERS', '2')),
+    max_queue=int(os.environ.get('REPORT_JOB_MAX_QUEUE', '100')),
+    ttl_hours=int(os.environ.get('REPORT_JOB_TTL_HOURS', '24')),
+    # A live worker finishes or fails a job within the render timeout
+    stale_seconds=2 * report_renderer.timeout,
+)
+
+async def render_and_cache_report(format: str, data: dict, cache_key: str) -> bytes:
+    try:
+        content = await report_renderer.render(format, data)
+    except RendererBusyError:
+        raise HTTPException(status_code=503, detail="Server sedang sibuk, silakan coba lagi")
+    except RenderTimeoutError:
+        raise HTTPException(status_code=504, detail="Pembuatan laporan melebihi batas waktu")
+
+    await report_cache.put(cache_key, content)
+    return content
+
+def attachment_response(format: str, filename: str, content: bytes):
+    return Response(
+        content=content,
+        media_type=MEDIA_TYPES[format],
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
+def report_response(format: str, trip: dict, content: bytes):
+    return attachment_response(format, report_filename(trip, format), content)
+
+async def generate_pdf_report(data: dict):
+    content = await render_report_bytes("pdf", data)
+    return report_response("pdf", data["trip"], content)
+
 async def generate_excel_report(data: dict):
-    from openpyxl import Workbook
-    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
-    
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "Laporan Perjalanan"
-    
-    trip = data["trip"]
-    user = data["user"]
-    
-    # Styles
-    title_font = Font(bold=True, size=14)
-    header_font = Font(bold=True, size=11)
-    normal_font = Font(size=10)
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
+    content = await render_report_bytes("xlsx", data)
+    return report_response("xlsx", data["trip"], content)
+
+# ============ REPORT ARTIFACTS ============
+
+async def archived_report(format: str, data: dict, current_user: dict) -> dict:
+    trip_id = data["trip"]["id"]
+    version = data_version(data)
+    artifact = await report_artifacts.find(trip_id, format, version)
+    if artifact is None:
+        artifact = await artifact_flights.run(
+            (trip_id, format, version), archive_report, format, data, version, current_user["id"]
+        )
+    return artifact
+
+async def archive_report(format: str, data: dict, version: str, user_id: str) -> dict:
+    # Re-check inside the flight: another process may have archived it meanwhile
+    artifact = await report_artifacts.find(data["trip"]["id"], format, version)
+    if artifact is not None:
+        return artifact
+    content = await render_report_bytes(format, data)
+    return await report_artifacts.put(report_filename(data["trip"], format), content, {
+        "trip_id": data["trip"]["id"],
+        "user_id": user_id,
+        "format": format,
+        "data_version": version,
+        "layout": layout_key(data),
+    })
+
+def artifact_response(artifact: dict, range_header: Optional[str] = None):
+    length = artifact["length"]
+    try:
+        byte_range = parse_range(range_header, length)
+    except RangeNotSatisfiableError:
+        raise HTTPException(status_code=416, detail="Range tidak valid", headers={"Content-Range": f"bytes */{length}"})
+    start, end = byte_range or (0, length - 1)
+    
+    headers = {
+        "Content-Disposition": f"attachment; filename={artifact['filename']}",
+        "Content-Length": str(end - start + 1),
+        "Accept-Ranges": "bytes",
+    }
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{length}"
+    return StreamingResponse(
+        report_artifacts.stream(artifact["_id"], start, end),
+        status_code=206 if byte_range else 200,
+        media_type=MEDIA_TYPES[artifact["metadata"]["format"]],
+        headers=headers
     )
-    header_fill = PatternFill(start_color="CCCCCC", end_color="CCCCCC", fill_type="solid")
-    
-    # Title
-    ws.merge_cells('A1:F1')
-    ws['A1'] = "LAPORAN PERJALANAN DINAS"
-    ws['A1'].font = title_font
-    ws['A1'].alignment = Alignment(horizontal='center')
-    
-    # Info Section
-    info = [
-        ("Nama", user["full_name"]),
-        ("NIP", user["nip"]),
-        ("Jabatan", user["jabatan"]),
-        ("Unit/Bagian", user["unit"]),
-        ("", ""),
-        ("Judul Perjalanan", trip["judul"]),
-        ("Tujuan", trip["tujuan"]),
-        ("Tanggal", f"{trip['tanggal_mulai']} s.d. {trip['tanggal_selesai']}"),
-        ("Dasar Perjalanan", trip["dasar_perjalanan"]),
-        ("Maksud dan Tujuan", trip["maksud_tujuan"]),
-    ]
-    
-    row = 3
-    for label, value in info:
-        ws[f'A{row}'] = label
-        ws[f'B{row}'] = ":"
-        ws[f'C{row}'] = value
-        row += 1
-    
-    # Itinerary Section
-    row += 1
-    ws[f'A{row}'] = "I. URAIAN KEGIATAN"
-    ws[f'A{row}'].font = header_font
-    row += 1
-    
-    headers = ["No", "Tanggal", "Waktu", "Kegiatan", "Lokasi"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row += 1
-    for i, it in enumerate(data["itineraries"], 1):
-        ws.cell(row=row, column=1, value=i).border = thin_border
-        ws.cell(row=row, column=2, value=it["tanggal"]).border = thin_border
-        ws.cell(row=row, column=3, value=it["waktu"]).border = thin_border
-        ws.cell(row=row, column=4, value=it["kegiatan"]).border = thin_border
-        ws.cell(row=row, column=5, value=it["lokasi"]).border = thin_border
-        row += 1
-    
-    # Expense Section
-    row += 1
-    ws[f'A{row}'] = "II. RINCIAN BIAYA"
-    ws[f'A{row}'].font = header_font
-    row += 1
-    
-    headers = ["No", "Tanggal", "Uraian", "Jumlah (Rp)"]
-    for col, header in enumerate(headers, 1):
-        cell = ws.cell(row=row, column=col, value=header)
-        cell.font = header_font
-        cell.fill = header_fill
-        cell.border = thin_border
-        cell.alignment = Alignment(horizontal='center')
-    
-    row += 1
-    for exp in data["expenses"]:
-        ws.cell(row=row, column=1, value=exp["nomor"]).border = thin_border
-        ws.cell(row=row, column=2, value=exp["tanggal"]).border = thin_border
-        ws.cell(row=row, column=3, value=exp["uraian"]).border = thin_border
-        cell = ws.cell(row=row, column=4, value=exp["jumlah"])
-        cell.border = thin_border
-        cell.number_format = '#,##0'
-        row += 1
-    
-    # Total
-    ws.cell(row=row, column=3, value="TOTAL").font = header_font
-    ws.cell(row=row, column=3).border = thin_border
-    total_cell = ws.cell(row=row, column=4, value=data["total_expense"])
-    total_cell.font = header_font
-    total_cell.border = thin_border
-    total_cell.number_format = '#,##0'
-    
-    # Column widths
-    ws.column_dimensions['A'].width = 5
-    ws.column_dimensions['B'].width = 12
-    ws.column_dimensions['C'].width = 40
-    ws.column_dimensions['D'].width = 15
-    ws.column_dimensions['E'].width = 15
-    
-    buffer = io.BytesIO()
-    wb.save(buffer)
-    buffer.seek(0)
-    
-    filename = f"laporan_perjalanan_{trip['judul'].replace(' ', '_')}.xlsx"
+
+def artifact_summary(artifact: dict) -> ReportArtifactResponse:
+    return ReportArtifactResponse(
+        id=str(artifact["_id"]),
+        format=artifact["metadata"]["format"],
+        filename=artifact["filename"],
+        size=artifact["length"],
+        data_version=artifact["metadata"]["data_version"],
+        created_at=artifact["uploadDate"].replace(tzinfo=timezone.utc).isoformat(),
+    )
+
+@api_router.get("/trips/{trip_id}/report/artifacts", response_model=List[ReportArtifactResponse])
+async def list_report_artifacts(trip_id: str, current_user: dict = Depends(get_current_user)):
+    # Keyed on the owner rather than the trip, so archives stay reachable for audits
+    artifacts = await report_artifacts.list(trip_id, current_user["id"])
+    return [artifact_summary(a) for a in artifacts]
+
+@api_router.get("/trips/{trip_id}/report/artifacts/{artifact_id}")
+async def download_report_artifact(trip_id: str, artifact_id: str,
+                                   range_header: Optional[str] = Header(None, alias="Range"),
+                                   current_user: dict = Depends(get_current_user)):
+    artifact = None
+    if ObjectId.is_valid(artifact_id):
+        artifact = await report_artifacts.get(ObjectId(artifact_id), current_user["id"])
+    if not artifact or artifact["metadata"]["trip_id"] != trip_id:
+        raise HTTPException(status_code=404, detail="Arsip laporan tidak ditemukan")
+    return artifact_response(artifact, range_header)
+
+# ============ BULK EXPORT ============
+
+REPORT_EXPORT_MAX_TRIPS = int(os.environ.get('REPORT_EXPORT_MAX_TRIPS', '500'))
+
+def export_entry_name(trip: dict, format: str) -> str:
+    name = report_filename(trip, format).replace("/", "_")
+    return f"{trip['tanggal_mulai']}_{trip['id'][:8]}_{name}"
+
+async def render_trip_for_export(trip: dict, format: str, current_user: dict):
+    # Any failure only skips this trip; it is listed in tidak_diekspor.txt
+    try:
+        validation = await load_report_data(trip["id"], current_user)
+        if not validation["can_generate"]:
+            return trip, None, "Data belum lengkap untuk generate laporan"
+        return trip, await render_report_bytes(format, validation), None
+    except HTTPException as e:
+        return trip, None, e.detail
+    except Exception as e:
+        logger.exception(f"Export of trip {trip['id']} failed")
+        return trip, None, str(e) or type(e).__name__
+
+@api_router.post("/reports/export")
+async def export_reports(export: ReportExportRequest, current_user: dict = Depends(get_current_user)):
+    query = trip_filter_query(current_user["id"], export.status, export.tujuan, export.dari_tanggal, export.sampai_tanggal)
+    if export.trip_ids is not None:
+        query["id"] = {"$in": export.trip_ids}
+    
+    trips = await db.trips.find(query, {"_id": 0}).sort("created_at", -1).to_list(REPORT_EXPORT_MAX_TRIPS + 1)
+    if not trips:
+        raise HTTPException(status_code=404, detail="Tidak ada perjalanan yang sesuai filter")
+    if len(trips) > REPORT_EXPORT_MAX_TRIPS:
+        raise HTTPException(status_code=400, detail=f"Maksimal {REPORT_EXPORT_MAX_TRIPS} perjalanan per ekspor")
+    
+    format = "xlsx" if export.format == "xlsx" else "pdf"
+    # At most one trip per worker is in flight or waiting to be written, and the next
+    # one starts only after a finished one went out, so a slow client stalls rendering
+    window = report_renderer.max_workers
+    
+    async def entries():
+        remaining = iter(trips)
+        pending = set()
+        skipped = []
+        
+        def refill():
+            for trip in remaining:
+                pending.add(asyncio.create_task(render_trip_for_export(trip, format, current_user)))
+                if len(pending) >= window:
+                    return
+        
+        try:
+            refill()
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    pending.discard(task)
+                    trip, content, error = task.result()
+                    if content is None:
+                        skipped.append(f"{trip['judul']} ({trip['id']}): {error}")
+                        continue
+                    yield export_entry_name(trip, format), content
+                refill()
+            if skipped:
+                yield "tidak_diekspor.txt", "\n".join(skipped).encode()
+        finally:
+            for task in pending:
+                task.cancel()
+    
+    filename = f"laporan_perjalanan_{datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')}.zip"
     return StreamingResponse(
-        buffer,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        stream_zip(entries()),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+# ============ DATA EXPORT ============
+
+EXPORT_KINDS = {"trips": TripResponse, "itineraries": ItineraryResponse, "expenses": ExpenseResponse}
+EXPORT_SORT = {
+    "itineraries": [("trip_id", 1), ("tanggal", 1), ("waktu", 1)],
+    "expenses": [("trip_id", 1), ("nomor", 1)],
+}
+EXPORT_CHUNK_BYTES = 64 * 1024
+EXPORT_TRIPS_PER_QUERY = 1000
+
+async def iter_export_docs(kind: str, user_id: str, trip_ids: List[str]):
+    # Plain cursors, no to_list caps; children are read in slices of the user's trip ids
+    projection = {"_id": 0, **{f: 1 for f in EXPORT_KINDS[kind].model_fields}}
+    if kind == "trips":
+        async for doc in db.trips.find({"user_id": user_id}, projection).sort("created_at", 1).batch_size(1000):
+            yield doc
+        return
+    for i in range(0, len(trip_ids), EXPORT_TRIPS_PER_QUERY):
+        query = {"trip_id": {"$in": trip_ids[i:i + EXPORT_TRIPS_PER_QUERY]}}
+        async for doc in db[kind].find(query, projection).sort(EXPORT_SORT[kind]).batch_size(1000):
+            yield doc
+
+@api_router.get("/export")
+async def export_account_data(format: str = "ndjson", kinds: Optional[str] = None,
+                              current_user: dict = Depends(get_current_user)):
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format harus ndjson atau csv")
+    selected = list(EXPORT_KINDS) if not kinds else [k.strip() for k in kinds.split(",") if k.strip()]
+    unknown = set(selected) - set(EXPORT_KINDS)
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Jenis data tidak dikenal: {', '.join(sorted(unknown))}")
+    if format == "csv" and len(selected) != 1:
+        raise HTTPException(status_code=400, detail="Ekspor CSV hanya untuk satu jenis data (kinds=trips|itineraries|expenses)")
+    
+    user_id = current_user["id"]
+    
+    async def rows():
+        trip_ids = []
+        if any(k != "trips" for k in selected):
+            async for trip in db.trips.find({"user_id": user_id}, {"_id": 0, "id": 1}).sort("id", 1):
+                trip_ids.append(trip["id"])
+        
+        buffer = io.StringIO()
+        writer = csv.writer(buffer) if format == "csv" else None
+        for kind in selected:
+            fields = list(EXPORT_KINDS[kind].model_fields)
+            if writer:
+                writer.writerow(fields)
+            async for doc in iter_export_docs(kind, user_id, trip_ids):
+                if writer:
+                    writer.writerow([doc.get(f, "") for f in fields])
+                else:
+                    buffer.write(json.dumps({"type": kind, **doc}, ensure_ascii=False, default=str))
+                    buffer.write("\n")
+                if buffer.tell() >= EXPORT_CHUNK_BYTES:
+                    yield buffer.getvalue().encode()
+                    buffer.seek(0)
+                    buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode()
+    
+    stamp = datetime.now(timezone.utc).strftime('%Y%m%d_%H%M%S')
+    if format == "csv":
+        media_type, filename = "text/csv; charset=utf-8", f"ekspor_{selected[0]}_{stamp}.csv"
+    else:
+        media_type, filename = "application/x-ndjson", f"ekspor_{stamp}.ndjson"
+    return StreamingResponse(
+        rows(),
+        media_type=media_type,
         headers={"Content-Disposition": f"attachment; filename={filename}"}
     )
 
@@ -744,6 +1634,15 @@ async def generate_excel_report(data: dict):
 async def health_check():
     return {"status": "healthy"}
 
+@api_router.get("/metrics")
+async def get_metrics():
+    return metrics.snapshot()
+
+# Prometheus scrape endpoint; same registry as /api/metrics in the text exposition format
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.exposition(), media_type=metrics.EXPOSITION_CONTENT_TYPE)
+
 # Include router and middleware
 app.include_router(api_router)
 
@@ -753,7 +1652,9 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified"],
 )
+app.add_middleware(RequestMetricsMiddleware)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -761,6 +1662,33 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def ensure_db_indexes():
+    try:
+        await ensure_indexes(db)
+    except Exception as e:
+        logger.error(f"Index provisioning failed: {e}")
+
+@app.on_event("startup")
+async def start_report_renderer():
+    await report_renderer.start()
+    await report_jobs.start()
+
+@app.on_event("startup")
+async def start_trip_reaper():
+    await trip_reaper.start()
+
+loop_lag_monitor = EventLoopLagMonitor(interval=float(os.environ.get('LOOP_LAG_INTERVAL_SECONDS', '0.5')))
+
+@app.on_event("startup")
+async def start_loop_lag_monitor():
+    await loop_lag_monitor.start()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
+    await report_jobs.stop()
+    await trip_reaper.stop()
+    await loop_lag_monitor.stop()
     client.close()
+    password_hasher.shutdown()
+    report_renderer.shutdown()
@@ -0,0 +1,37 @@
+import asyncio
+
+import metrics
+
+COALESCED_CALLS = metrics.counter(
+    "singleflight_coalesced_total", "Calls that joined an in-flight call instead of running their own", ["group"]
+)
+LEADER_CALLS = metrics.counter(
+    "singleflight_calls_total", "Calls that actually ran because nothing identical was in flight", ["group"]
+)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one execution.
+
+    The first caller for a key starts the work as a task; callers arriving while
+    it runs await the same task and get its result (or exception). The task is
+    shielded, so a caller that disconnects does not cancel it for the others.
+    """
+
+    def __init__(self, group: str):
+        self.group = group
+        self._inflight = {}
+
+    async def run(self, key, fn, *args):
+        task = self._inflight.get(key)
+        if task is None:
+            LEADER_CALLS.inc(group=self.group)
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            COALESCED_CALLS.inc(group=self.group)
+        return await asyncio.shield(task)
+
+    def __len__(self):
+        return len(self._inflight)
@@ -0,0 +1,94 @@
+import asyncio
+import logging
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone, timedelta
+
+logger = logging.getLogger(__name__)
+
+_support = {}
+
+
+async def supports_transactions(client) -> bool:
+    """Whether the deployment behind ``client`` is a replica set or sharded cluster."""
+    key = id(client)
+    if key not in _support:
+        try:
+            hello = await client.admin.command("hello")
+            _support[key] = bool(hello.get("setName") or hello.get("msg") == "isdbgrid")
+        except Exception as e:
+            logger.warning(f"Could not detect transaction support, running without transactions: {e}")
+            _support[key] = False
+        if not _support[key]:
+            logger.info("MongoDB is standalone; multi-document writes run without a transaction")
+    return _support[key]
+
+
+async def run_in_transaction(client, callback):
+    """Run ``callback(session)`` inside a transaction, retrying transient errors.
+
+    On a standalone mongod (no transactions) ``callback(None)`` runs directly,
+    without atomicity or isolation: concurrent callbacks interleave freely.
+    Callers must pass ``session`` through to every operation; writes that read
+    and then rewrite shared state (e.g. expense numbering) need
+    ``run_serialized`` instead.
+    """
+    if not await supports_transactions(client):
+        return await callback(None)
+    async with await client.start_session() as session:
+        return await session.with_transaction(callback)
+
+
+class LeaseTimeoutError(Exception):
+    pass
+
+
+@asynccontextmanager
+async def leased(collection, ids, field: str = "lease", ttl: float = 30.0, wait: float = 10.0):
+    """Hold an exclusive lease on the documents of ``collection`` with the given ``id``s.
+
+    Leases are claimed in id order, so two holders never wait on each other,
+    and expire after ``ttl`` seconds in case the holder dies. Documents that do
+    not exist are skipped. Raises ``LeaseTimeoutError`` after ``wait`` seconds.
+    """
+    token = uuid.uuid4().hex
+    held = []
+    try:
+        for doc_id in sorted(set(ids)):
+            deadline = asyncio.get_running_loop().time() + wait
+            delay = 0.02
+            while True:
+                now = datetime.now(timezone.utc)
+                claimed = await collection.find_one_and_update(
+                    {"id": doc_id, "$or": [{field: {"$exists": False}}, {f"{field}.expires_at": {"$lt": now}}]},
+                    {"$set": {field: {"token": token, "expires_at": now + timedelta(seconds=ttl)}}},
+                    projection={"_id": 1},
+                )
+                if claimed is not None:
+                    held.append(doc_id)
+                    break
+                if not await collection.find_one({"id": doc_id}, {"_id": 1}):
+                    break
+                if asyncio.get_running_loop().time() > deadline:
+                    raise LeaseTimeoutError(f"lease on {doc_id} still held after {wait}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 0.5)
+        yield
+    finally:
+        if held:
+            await collection.update_many(
+                {"id": {"$in": held}, f"{field}.token": token}, {"$unset": {field: ""}}
+            )
+
+
+async def run_serialized(client, collection, ids, callback):
+    """``run_in_transaction`` for writes that must not interleave per document.
+
+    With transactions, write conflicts on the documents serialize them already.
+    On a standalone mongod the callback runs while holding a lease on each of
+    ``ids`` in ``collection``, so such writes take turns instead.
+    """
+    if await supports_transactions(client):
+        return await run_in_transaction(client, callback)
+    async with leased(collection, ids):
+        return await callback(None)
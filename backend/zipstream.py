@@ -0,0 +1,38 @@
+import zipfile
+
+
+class _ChunkBuffer:
+    """Write-only file object that hands written bytes back out as chunks."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+async def stream_zip(entries, compression=zipfile.ZIP_STORED):
+    """Yield a ZIP archive chunk by chunk from an async iterator of (name, bytes).
+
+    Each member is written out before the next one is pulled from ``entries``,
+    so the archive holds one member at a time; how many more the producer
+    renders ahead is up to it (a lazy generator keeps that bounded). The output is not seekable; zipfile handles that by
+    writing sizes into the local headers (known up front for ``writestr``).
+    PDF and XLSX are already compressed, hence ``ZIP_STORED`` by default.
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, mode="w", compression=compression) as zf:
+        async for name, content in entries:
+            zf.writestr(name, content)
+            for chunk in buffer.drain():
+                yield chunk
+    for chunk in buffer.drain():
+        yield chunk
@@ -41,8 +41,10 @@ export const authAPI = {
 
 // Trips
 export const tripsAPI = {
-  getAll: () => api.get('/trips'),
+  getAll: (params) => api.get('/trips', { params }),
+  getStats: () => api.get('/trips/stats'),
   getOne: (id) => api.get(`/trips/${id}`),
+  getBundle: (id, include) => api.get(`/trips/${id}/bundle`, { params: include ? { include } : {} }),
   create: (data) => api.post('/trips', data),
   update: (id, data) => api.put(`/trips/${id}`, data),
   delete: (id) => api.delete(`/trips/${id}`),
@@ -54,6 +56,7 @@ export const itinerariesAPI = {
   create: (tripId, data) => api.post(`/trips/${tripId}/itineraries`, data),
   update: (tripId, id, data) => api.put(`/trips/${tripId}/itineraries/${id}`, data),
   delete: (tripId, id) => api.delete(`/trips/${tripId}/itineraries/${id}`),
+  batch: (tripId, data) => api.post(`/trips/${tripId}/itineraries:batch`, data),
 };
 
 // Expenses
@@ -62,6 +65,30 @@ export const expensesAPI = {
   create: (tripId, data) => api.post(`/trips/${tripId}/expenses`, data),
   update: (tripId, id, data) => api.put(`/trips/${tripId}/expenses/${id}`, data),
   delete: (tripId, id) => api.delete(`/trips/${tripId}/expenses/${id}`),
+  batch: (tripId, data) => api.post(`/trips/${tripId}/expenses:batch`, data),
+};
+
+// Import
+export const importAPI = {
+  upload: (kind, file, tripId) => {
+    const form = new FormData();
+    form.append('file', file);
+    return api.post(`/import/${kind}`, form, {
+      params: tripId ? { trip_id: tripId } : {},
+      headers: { 'Content-Type': 'multipart/form-data' },
+    });
+  },
+};
+
+// Delta sync: pass the cursor from the previous response; reset=true means replace local data
+export const syncAPI = {
+  changes: (since) => api.get('/sync', { params: since ? { since } : {} }),
+};
+
+// Full account export (streamed; format 'ndjson' or 'csv' with a single kind)
+export const exportAPI = {
+  download: (format = 'ndjson', kinds) =>
+    api.get('/export', { params: { format, ...(kinds ? { kinds } : {}) }, responseType: 'blob' }),
 };
 
 // Report
@@ -72,6 +99,24 @@ export const reportAPI = {
       responseType: 'blob',
     });
   },
+  createJob: (tripId, format) => api.post(`/trips/${tripId}/report/jobs?format=${format}`),
+  getJob: (tripId, jobId) => api.get(`/trips/${tripId}/report/jobs/${jobId}`),
+  downloadJob: (tripId, jobId) => {
+    return api.get(`/trips/${tripId}/report/jobs/${jobId}/file`, {
+      responseType: 'blob',
+    });
+  },
+  listArtifacts: (tripId) => api.get(`/trips/${tripId}/report/artifacts`),
+  downloadArtifact: (tripId, artifactId) => {
+    return api.get(`/trips/${tripId}/report/artifacts/${artifactId}`, {
+      responseType: 'blob',
+    });
+  },
+  exportZip: (filter) => {
+    return api.post('/reports/export', filter, {
+      responseType: 'blob',
+    });
+  },
 };
 
 export default api;
@@ -14,23 +14,31 @@ import {
   DialogTitle,
 } from '../components/ui/dialog';
 import { toast } from 'sonner';
-import { Plus, Edit, Trash2, Calendar, MapPin, FileText, Plane, ChevronRight } from 'lucide-react';
+import { Plus, Edit, Trash2, Calendar, MapPin, FileText, Plane, ChevronRight, Wallet } from 'lucide-react';
+
+const PAGE_SIZE = 20;
+const LIST_FIELDS = 'judul,tujuan,tanggal_mulai,tanggal_selesai,maksud_tujuan,status';
 
 export default function DashboardPage() {
   const [trips, setTrips] = useState([]);
+  const [stats, setStats] = useState(null);
+  const [nextCursor, setNextCursor] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [deleteId, setDeleteId] = useState(null);
   const [deleting, setDeleting] = useState(false);
   const navigate = useNavigate();
 
   useEffect(() => {
     fetchTrips();
+    fetchStats();
   }, []);
 
   const fetchTrips = async () => {
     try {
-      const res = await tripsAPI.getAll();
+      const res = await tripsAPI.getAll({ limit: PAGE_SIZE, fields: LIST_FIELDS });
       setTrips(res.data);
+      setNextCursor(res.headers['x-next-cursor'] || null);
     } catch (error) {
       toast.error('Gagal memuat data perjalanan');
     } finally {
@@ -38,6 +46,30 @@ export default function DashboardPage() {
     }
   };
 
+  // Loaded on its own so a failing stats query never hides the trip list
+  const fetchStats = async () => {
+    try {
+      const res = await tripsAPI.getStats();
+      setStats(res.data);
+    } catch (error) {
+      toast.error('Gagal memuat statistik perjalanan');
+    }
+  };
+
+  const fetchMore = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const res = await tripsAPI.getAll({ limit: PAGE_SIZE, fields: LIST_FIELDS, cursor: nextCursor });
+      setTrips((prev) => [...prev, ...res.data]);
+      setNextCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('Gagal memuat data perjalanan');
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
   const handleDelete = async () => {
     if (!deleteId) return;
     setDeleting(true);
@@ -45,6 +77,7 @@ export default function DashboardPage() {
       await tripsAPI.delete(deleteId);
       toast.success('Perjalanan berhasil dihapus');
       fetchTrips();
+      fetchStats();
     } catch (error) {
       toast.error('Gagal menghapus perjalanan');
     } finally {
@@ -58,8 +91,18 @@ export default function DashboardPage() {
     return date.toLocaleDateString('id-ID', { day: 'numeric', month: 'short', year: 'numeric' });
   };
 
-  const draftCount = trips.filter(t => t.status === 'draft').length;
-  const completedCount = trips.filter(t => t.status === 'completed').length;
+  const formatRupiah = (amount) => {
+    return new Intl.NumberFormat('id-ID', {
+      style: 'currency',
+      currency: 'IDR',
+      minimumFractionDigits: 0,
+    }).format(amount);
+  };
+
+  const totalCount = stats?.total_trips ?? 0;
+  const draftCount = stats?.draft_count ?? 0;
+  const completedCount = stats?.completed_count ?? 0;
+  const totalExpense = stats?.total_expense ?? 0;
 
   return (
     <MainLayout>
@@ -85,14 +128,14 @@ export default function DashboardPage() {
         </div>
 
         {/* Stats */}
-        <div className="grid grid-cols-1 sm:grid-cols-3 gap-4 mb-8">
+        <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-4 gap-4 mb-8">
           <Card className="border-slate-200">
             <CardContent className="p-6">
               <div className="flex items-center justify-between">
                 <div>
                   <p className="text-sm text-slate-600">Total Perjalanan</p>
                   <p className="text-3xl font-bold text-slate-900" style={{ fontFamily: 'Manrope' }}>
-                    {trips.length}
+                    {totalCount}
                   </p>
                 </div>
                 <div className="w-12 h-12 bg-emerald-100 rounded-xl flex items-center justify-center">
@@ -131,6 +174,21 @@ export default function DashboardPage() {
               </div>
             </CardContent>
           </Card>
+          <Card className="border-slate-200">
+            <CardContent className="p-6">
+              <div className="flex items-center justify-between">
+                <div>
+                  <p className="text-sm text-slate-600">Total Biaya</p>
+                  <p className="text-2xl font-bold text-slate-900" style={{ fontFamily: 'Manrope' }} data-testid="total-expense-stat">
+                    {formatRupiah(totalExpense)}
+                  </p>
+                </div>
+                <div className="w-12 h-12 bg-slate-100 rounded-xl flex items-center justify-center">
+                  <Wallet className="w-6 h-6 text-slate-600" />
+                </div>
+              </div>
+            </CardContent>
+          </Card>
         </div>
 
         {/* Trips List */}
@@ -224,6 +282,18 @@ export default function DashboardPage() {
                 </CardContent>
               </Card>
             ))}
+            {nextCursor && (
+              <div className="text-center pt-2">
+                <Button
+                  variant="outline"
+                  onClick={fetchMore}
+                  disabled={loadingMore}
+                  data-testid="load-more-trips-btn"
+                >
+                  {loadingMore ? 'Memuat...' : 'Muat Lebih Banyak'}
+                </Button>
+              </div>
+            )}
           </div>
         )}
       </div>
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { tripsAPI, itinerariesAPI, expensesAPI } from '../lib/api';
+import { tripsAPI } from '../lib/api';
 import MainLayout from '../components/MainLayout';
 import { Button } from '../components/ui/button';
 import { Badge } from '../components/ui/badge';
@@ -36,14 +36,10 @@ export default function TripDetailPage() {
 
   const fetchData = async () => {
     try {
-      const [tripRes, itinRes, expRes] = await Promise.all([
-        tripsAPI.getOne(id),
-        itinerariesAPI.getAll(id),
-        expensesAPI.getAll(id),
-      ]);
-      setTrip(tripRes.data);
-      setItineraries(itinRes.data);
-      setExpenses(expRes.data);
+      const res = await tripsAPI.getBundle(id, 'trip,itineraries,expenses');
+      setTrip(res.data.trip);
+      setItineraries(res.data.itineraries);
+      setExpenses(res.data.expenses);
     } catch (error) {
       toast.error('Gagal memuat data perjalanan');
       navigate('/dashboard');